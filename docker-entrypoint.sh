@@ -1,4 +1,3 @@
 #!/bin/sh
-python manage.py migrate
-python manage.py createcachetable
-gunicorn recipe_api.wsgi:application -b :80 --workers=3 --threads=2 --keep-alive=2
+python manage.py bootstrap
+exec gunicorn recipe_api.wsgi:application -c gunicorn.conf.py
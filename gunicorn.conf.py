@@ -0,0 +1,23 @@
+import time
+
+# recorded before the app is loaded for the startup report
+STARTED = time.monotonic()
+
+bind = ':80'
+workers = 3
+threads = 2
+keepalive = 2
+# load the app in the master so the workers share it copy-on-write (see recipe_api/startup.py)
+preload_app = True
+
+
+def when_ready(server):
+    # runs in the master after the app is loaded and before the workers are forked
+    from recipe_api.startup import preload
+    preload(started=STARTED)
+
+
+def worker_exit(server, worker):
+    # close the worker's pooled database connections (if the pooled backend is used) vs leaving them to time out
+    from recipe_api.backends.postgresql_pool.base import close_pools
+    close_pools()
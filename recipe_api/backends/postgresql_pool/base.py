@@ -0,0 +1,200 @@
+import logging
+import os
+import threading
+import time
+from collections import deque
+
+import psycopg2
+from psycopg2 import extensions
+from django.db.backends.postgresql import base
+
+logger = logging.getLogger(__name__)
+
+# pools by (database alias, process id) since connections can't be shared by forked worker processes
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+class PoolTimeout(psycopg2.OperationalError):
+    pass
+
+
+class ConnectionPool:
+    """
+    Bounded, thread-safe pool of psycopg2 connections.
+
+    Checkouts wait up to `timeout` seconds for a connection when all `max_size` connections are in use.
+    Connections which have been idle for longer than `health_check_seconds` are checked before they're reused.
+
+    The pool's stats are logged (at most every `log_interval` seconds) when checkouts have to wait so saturation is
+    visible without profiling.
+    """
+    log_interval = 60
+
+    def __init__(self, alias: str, max_size: int, timeout: float, health_check_seconds: float):
+        self.alias = alias
+        self.max_size = max_size
+        self.timeout = timeout
+        self.health_check_seconds = health_check_seconds
+        self._idle = deque()  # (connection, time returned to the pool)
+        self._size = 0
+        self._condition = threading.Condition()
+        self._logged = None
+        self.counters = {
+            'checkouts': 0,
+            'waits': 0,
+            'timeouts': 0,
+            'connections_created': 0,
+            'connections_discarded': 0,
+            'health_checks': 0,
+        }
+
+    def stats(self) -> dict:
+        with self._condition:
+            return dict(self.counters, size=self._size, idle=len(self._idle), in_use=self._size - len(self._idle))
+
+    def checkout(self, connect):
+        deadline = time.monotonic() + self.timeout
+        connection = None
+        with self._condition:
+            self.counters['checkouts'] += 1
+            waited = False
+            while True:
+                if self._idle:
+                    connection, returned = self._idle.pop()
+                    break
+                if self._size < self.max_size:
+                    # reserve a slot for a new connection
+                    self._size += 1
+                    break
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    self.counters['timeouts'] += 1
+                    logger.warning('Timed out waiting for a "{}" database connection: {}'.format(self.alias, self.counters))
+                    raise PoolTimeout('Timed out after {}s waiting for a database connection'.format(self.timeout))
+                if not waited:
+                    self.counters['waits'] += 1
+                    waited = True
+                    if self._logged is None or time.monotonic() - self._logged >= self.log_interval:
+                        self._logged = time.monotonic()
+                        logger.warning('Waiting for a "{}" database connection: {}'.format(
+                            self.alias, dict(self.counters, size=self._size, idle=len(self._idle))))
+                self._condition.wait(remaining)
+
+        if connection is not None:
+            if time.monotonic() - returned < self.health_check_seconds or self._is_healthy(connection):
+                return connection
+            # replace the unhealthy connection while keeping its slot
+            self._close(connection)
+
+        try:
+            connection = connect()
+        except Exception:
+            self._release_slot()
+            raise
+        with self._condition:
+            self.counters['connections_created'] += 1
+        return connection
+
+    def checkin(self, connection):
+        if not connection.closed and connection.info.transaction_status != extensions.TRANSACTION_STATUS_IDLE:
+            try:
+                connection.rollback()
+            except psycopg2.Error:
+                pass
+        if connection.closed or connection.info.transaction_status != extensions.TRANSACTION_STATUS_IDLE:
+            self._close(connection)
+            self._release_slot()
+            return
+        with self._condition:
+            self._idle.append((connection, time.monotonic()))
+            self._condition.notify()
+
+    def close_all(self):
+        with self._condition:
+            while self._idle:
+                connection, _ = self._idle.pop()
+                self._close(connection)
+                self._size -= 1
+
+    def _is_healthy(self, connection) -> bool:
+        with self._condition:
+            self.counters['health_checks'] += 1
+        if connection.closed:
+            return False
+        try:
+            with connection.cursor() as cursor:
+                cursor.execute('SELECT 1')
+            # the check may have started a transaction when autocommit is off
+            if connection.info.transaction_status != extensions.TRANSACTION_STATUS_IDLE:
+                connection.rollback()
+            return True
+        except psycopg2.Error:
+            return False
+
+    def _close(self, connection):
+        with self._condition:
+            self.counters['connections_discarded'] += 1
+        try:
+            connection.close()
+        except psycopg2.Error:
+            pass
+
+    def _release_slot(self):
+        with self._condition:
+            self._size -= 1
+            self._condition.notify()
+
+
+def get_pool_stats() -> dict:
+    # stats for the current process's pools by database alias
+    pid = os.getpid()
+    return {alias: pool.stats() for (alias, pool_pid), pool in list(_pools.items()) if pool_pid == pid}
+
+
+def close_pools():
+    # closes the current process's idle pooled connections, e.g., when a gunicorn worker exits (see gunicorn.conf.py)
+    pid = os.getpid()
+    for (alias, pool_pid), pool in list(_pools.items()):
+        if pool_pid == pid:
+            logger.info('Closing "{}" database pool: {}'.format(alias, pool.stats()))
+            pool.close_all()
+
+
+class DatabaseWrapper(base.DatabaseWrapper):
+    """
+    PostgreSQL backend which checks connections out of a bounded, per-process pool instead of connecting each time.
+
+    Connections are returned to the pool whenever django closes them, e.g., at the end of every request, so "CONN_MAX_AGE"
+    should be 0.  The pool is configured with the database's "POOL" setting:
+
+        MAX_SIZE - maximum connections per process
+        TIMEOUT - seconds to wait for a free connection
+        HEALTH_CHECK_SECONDS - idle connections older than this are checked before they're reused
+    """
+
+    @property
+    def pool(self) -> ConnectionPool:
+        key = (self.alias, os.getpid())
+        if key not in _pools:
+            with _pools_lock:
+                if key not in _pools:
+                    options = self.settings_dict.get('POOL', {})
+                    _pools[key] = ConnectionPool(
+                        alias=self.alias,
+                        max_size=options.get('MAX_SIZE', 4),
+                        timeout=options.get('TIMEOUT', 10),
+                        health_check_seconds=options.get('HEALTH_CHECK_SECONDS', 30),
+                    )
+        return _pools[key]
+
+    def get_new_connection(self, conn_params):
+        connection = self.pool.checkout(lambda: super(DatabaseWrapper, self).get_new_connection(conn_params))
+        # reused connections were created by another wrapper so set the isolation level just like the base wrapper
+        self.isolation_level = self.settings_dict['OPTIONS'].get('isolation_level', connection.isolation_level)
+        return connection
+
+    def _close(self):
+        if self.connection is not None:
+            with self.wrap_database_errors:
+                self.pool.checkin(self.connection)
@@ -0,0 +1,155 @@
+import cProfile
+import io
+import json
+import logging
+import os
+import pstats
+import random
+import time
+import uuid
+from contextlib import ExitStack
+
+from django.conf import settings
+from django.db import connections, DatabaseError
+from django.http import JsonResponse
+from django.utils.cache import add_never_cache_headers
+
+from recipe_api.backends.postgresql_pool.base import get_pool_stats
+from recipe_api.routers import use_replica
+
+SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS')
+
+
+class ReplicaMiddleware:
+    """
+    Serves safe (read-only) api requests from the read replicas.
+
+    Clients which have just written (e.g., through the admin) are pinned to the primary for
+    `DATABASE_REPLICA_STICKY_SECONDS` so they read their own writes.
+    """
+    cookie_name = 'use_primary'
+    path_prefix = '/api/'
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if not settings.DATABASE_REPLICAS:
+            return self.get_response(request)
+
+        if request.method in SAFE_METHODS and request.path.startswith(self.path_prefix) and self.cookie_name not in request.COOKIES:
+            with use_replica():
+                return self.get_response(request)
+
+        response = self.get_response(request)
+        if request.method not in SAFE_METHODS:
+            response.set_cookie(self.cookie_name, '1', max_age=settings.DATABASE_REPLICA_STICKY_SECONDS, httponly=True)
+        return response
+
+
+class ProfilingMiddleware:
+    """
+    Profiles api requests: a cProfile breakdown, every SQL statement with its timing and
+    `EXPLAIN (ANALYZE, BUFFERS)` for the slowest statements, e.g., the search and category filter queries.
+
+    Staff can profile any api request with the "X-Profile: 1" header or "?_profile=1", and the profile is returned
+    instead of the response.  Other requests can be sampled (`PROFILE_SAMPLE_RATE` which is off by default) and their
+    profile is saved to `PROFILE_DIR` when they're slower than `PROFILE_SLOW_REQUEST_SECONDS`.
+    """
+    path_prefix = '/api/'
+    explain_limit = 3
+    stats_limit = 40
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if not request.path.startswith(self.path_prefix):
+            return self.get_response(request)
+
+        requested = request.user.is_staff and '1' in (request.META.get('HTTP_X_PROFILE'), request.GET.get('_profile'))
+        if not requested and random.random() >= settings.PROFILE_SAMPLE_RATE:
+            return self.get_response(request)
+
+        response, profile, queries = self.profile(request)
+        slow = profile['seconds'] >= settings.PROFILE_SLOW_REQUEST_SECONDS
+        if not requested and not slow:
+            return response
+
+        # explaining re-executes the queries so it's only done for profiles which are returned or saved
+        profile['explain'] = self.explain(queries)
+        if requested:
+            response = JsonResponse(profile)
+            add_never_cache_headers(response)
+        else:
+            self.save(profile)
+        return response
+
+    def profile(self, request):
+        queries = []
+
+        def log_query(execute, sql, params, many, context):
+            started = time.perf_counter()
+            try:
+                return execute(sql, params, many, context)
+            finally:
+                queries.append({
+                    'alias': context['connection'].alias,
+                    'sql': sql,
+                    'params': params if not many else None,
+                    'seconds': time.perf_counter() - started,
+                })
+
+        profiler = cProfile.Profile()
+        started = time.perf_counter()
+        with ExitStack() as stack:
+            for connection in connections.all():
+                stack.enter_context(connection.execute_wrapper(log_query))
+            try:
+                profiler.enable()
+            except ValueError:  # another profiler is active in this process
+                profiler = None
+            try:
+                response = self.get_response(request)
+            finally:
+                if profiler:
+                    profiler.disable()
+        seconds = time.perf_counter() - started
+
+        stats = io.StringIO()
+        if profiler:
+            pstats.Stats(profiler, stream=stats).sort_stats('cumulative').print_stats(self.stats_limit)
+
+        return response, {
+            'method': request.method,
+            'path': request.get_full_path(),
+            'status': response.status_code,
+            'seconds': seconds,
+            'query_seconds': sum(q['seconds'] for q in queries),
+            'queries': queries,
+            'profile': stats.getvalue(),
+            'pool': get_pool_stats(),
+        }, queries
+
+    def explain(self, queries: list) -> list:
+        # analyze the slowest select statements (they're executed again)
+        selects = [q for q in queries if q['params'] is not None and q['sql'].lstrip().upper().startswith('SELECT')]
+        explained = []
+        for query in sorted(selects, key=lambda q: q['seconds'], reverse=True)[:self.explain_limit]:
+            try:
+                with connections[query['alias']].cursor() as cursor:
+                    cursor.execute('EXPLAIN (ANALYZE, BUFFERS) {}'.format(query['sql']), query['params'])
+                    plan = '\n'.join(row[0] for row in cursor.fetchall())
+            except DatabaseError as e:
+                plan = 'Could not explain query: {}'.format(e)
+            explained.append({'sql': query['sql'], 'plan': plan})
+        return explained
+
+    def save(self, profile: dict):
+        os.makedirs(settings.PROFILE_DIR, exist_ok=True)
+        # unique since a worker can profile several requests per second
+        path = os.path.join(settings.PROFILE_DIR, '{}-{}-{}.json'.format(
+            time.strftime('%Y%m%d-%H%M%S'), os.getpid(), uuid.uuid4().hex[:8]))
+        with open(path, 'w') as fp:
+            json.dump(profile, fp, indent=2, default=str)
+        logging.warning('Slow request {} ({:.2f}s) profiled in {}'.format(profile['path'], profile['seconds'], path))
@@ -0,0 +1,39 @@
+import random
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.conf import settings
+
+# database alias of the replica which reads should be routed to
+_replica = ContextVar('replica', default=None)
+
+
+@contextmanager
+def use_replica():
+    # route reads to a single (random) replica so queries within a request are consistent with each other
+    token = _replica.set(random.choice(settings.DATABASE_REPLICAS) if settings.DATABASE_REPLICAS else None)
+    try:
+        yield
+    finally:
+        _replica.reset(token)
+
+
+class ReplicaRouter:
+    """
+    Routes reads to a read replica while `use_replica()` is active (i.e., safe api requests, see `ReplicaMiddleware`).
+
+    Everything else, including writes, the scraper and migrations, uses the primary.
+    """
+
+    def db_for_read(self, model, **hints):
+        return _replica.get() or 'default'
+
+    def db_for_write(self, model, **hints):
+        return 'default'
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # replicas have the same data as the primary
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return db == 'default'
@@ -0,0 +1,53 @@
+import json
+import logging
+import os
+import time
+from contextlib import contextmanager
+
+from django.db import connections
+from django.urls import get_resolver
+
+from recipe_api.backends.postgresql_pool.base import close_pools
+from recipe_api.settings import CACHE_DIR
+
+STARTUP_REPORT_FILE = os.path.join(CACHE_DIR, 'startup.json')
+
+
+def preload(started: float) -> dict:
+    """
+    Warms the gunicorn master before it forks the workers (see gunicorn.conf.py) so they share the imported modules
+    and hot read-only data copy-on-write vs each worker loading them separately.
+
+    Returns a startup report, i.e., seconds for each phase, which is logged and saved to `STARTUP_REPORT_FILE`.
+    """
+    report = {'app': time.monotonic() - started}
+
+    @contextmanager
+    def phase(name):
+        phase_started = time.monotonic()
+        yield
+        report[name] = time.monotonic() - phase_started
+
+    with phase('urls'):
+        # imports every view, serializer and filter
+        get_resolver().url_patterns
+
+    with phase('indexes'):
+        from recipes.index import pantry_index, similar_index, spelling_index
+        pantry_index.get()
+        similar_index.get()
+        spelling_index.get()
+
+    # database connections must not be shared with the forked workers (including the master's pooled connections)
+    connections.close_all()
+    close_pools()
+
+    report['total'] = time.monotonic() - started
+    logging.info('Startup: {}'.format(', '.join('{} {:.3f}s'.format(k, v) for k, v in report.items())))
+    try:
+        os.makedirs(CACHE_DIR, exist_ok=True)
+        with open(STARTUP_REPORT_FILE, 'w') as fp:
+            json.dump(report, fp, indent=2)
+    except OSError as e:
+        logging.warning('Could not save startup report: {}'.format(e))
+    return report
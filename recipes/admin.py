@@ -1,21 +1,112 @@
 from django.contrib import admin
-from recipes.models import Category, Recipe
+from django.contrib.postgres.search import SearchQuery
+from django.core.paginator import Paginator
+from django.db.models import Q
+from django.utils.functional import cached_property
+
+from recipe_api.settings import POSTGRES_LANGUAGE_UNACCENT
+from recipes.duplicates import recipe_minhash
+from recipes.models import Category, Recipe, DataVersion
+from recipes.queries import estimate_count
+
+
+class DataChangedAdminMixin:
+    # keep the search table and data version in sync with changes made through the admin
+
+    def data_changed(self):
+        # refreshing is expensive so it's flagged alongside the change and done by the scheduled "refreshsearch" command
+        DataVersion.request_refresh()
+
+    def save_related(self, request, form, formsets, change):
+        # the search table includes the categories so refresh after they've been saved
+        super().save_related(request, form, formsets, change)
+        self.data_changed()
+
+    def delete_model(self, request, obj):
+        super().delete_model(request, obj)
+        self.data_changed()
+
+    def delete_queryset(self, request, queryset):
+        super().delete_queryset(request, queryset)
+        self.data_changed()
+
+
+class EstimatedCountPaginator(Paginator):
+    # the planner's row estimate vs an exact COUNT for large result sets
+    exact_count_limit = 10000
+
+    @cached_property
+    def count(self):
+        estimate = estimate_count(self.object_list)
+        if estimate < self.exact_count_limit:
+            return super().count
+        return estimate
 
 
 class RecipeInlineAdmin(admin.TabularInline):
-    model = Recipe
+    # a recipe's category relationships which only loads the related recipe's id and name
+    model = Recipe.categories.through
+    autocomplete_fields = ('recipe',)
     extra = 0
 
 
 @admin.register(Category)
-class CategoryAdmin(admin.ModelAdmin):
+class CategoryAdmin(DataChangedAdminMixin, admin.ModelAdmin):
     search_fields = ('name', 'type',)
     list_display = ('name', 'type',)
     list_filter = ('type',)
 
+    def save_model(self, request, obj, form, change):
+        super().save_model(request, obj, form, change)
+        # the search vectors include the category names so a rename rebuilds those of its recipes
+        if change and 'name' in form.changed_data:
+            Recipe.objects.filter(categories=obj).update_search_vectors()
+
+    def delete_model(self, request, obj):
+        # the relationships are deleted with the category so its recipes are found beforehand
+        recipe_ids = list(Recipe.objects.filter(categories=obj).values_list('pk', flat=True))
+        super().delete_model(request, obj)
+        Recipe.objects.filter(pk__in=recipe_ids).update_search_vectors()
+
+    def delete_queryset(self, request, queryset):
+        recipe_ids = list(Recipe.objects.filter(categories__in=queryset).values_list('pk', flat=True).distinct())
+        super().delete_queryset(request, queryset)
+        Recipe.objects.filter(pk__in=recipe_ids).update_search_vectors()
+
 
 @admin.register(Recipe)
-class RecipeAdmin(admin.ModelAdmin):
+class RecipeAdmin(DataChangedAdminMixin, admin.ModelAdmin):
     search_fields = ('name',)
     list_display = ('name', 'date_added',)
-    list_filter = ('categories',)
+    autocomplete_fields = ('categories',)
+    # set by the "dedupe" command (and an editable select would load every recipe)
+    readonly_fields = ('duplicate_of',)
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+
+    def get_queryset(self, request):
+        queryset = super().get_queryset(request)
+        # the changelist (and autocomplete) only display names so skip the large columns
+        if request.resolver_match and request.resolver_match.url_name in ('recipes_recipe_changelist', 'autocomplete'):
+            queryset = queryset.defer('description', 'ingredients', 'instructions', 'search_vector')
+        return queryset
+
+    def save_model(self, request, obj, form, change):
+        # the signature is recomputed and duplicates are found again with the next "dedupe"
+        obj.minhash = recipe_minhash(obj.ingredients, obj.instructions)
+        super().save_model(request, obj, form, change)
+        Recipe.objects.filter(pk=obj.pk).update_popularity()
+
+    def save_related(self, request, form, formsets, change):
+        super().save_related(request, form, formsets, change)
+        # the search vector includes the categories so it's rebuilt once they've been saved
+        Recipe.objects.filter(pk=form.instance.pk).update_search_vectors()
+
+    def get_search_results(self, request, queryset, search_term):
+        # full-text search using the indexed search vector (with web search syntax) vs "icontains" table scans
+        search_term = search_term.replace('\x00', '').strip()
+        if not search_term:
+            return queryset, False
+        search_query = SearchQuery(search_term, search_type='websearch', config=POSTGRES_LANGUAGE_UNACCENT)
+        # or the exact (indexed) slug, e.g., for recipes without a search vector
+        return queryset.filter(Q(search_vector=search_query) | Q(slug=search_term)), False
@@ -0,0 +1,201 @@
+import gzip
+import hashlib
+import re
+from array import array
+from functools import wraps
+
+import brotli
+from django.conf import settings
+from django.core.cache import cache
+from django.http import HttpResponse
+from django.utils.cache import patch_response_headers, patch_vary_headers
+from django.views.decorators.gzip import gzip_page
+
+from recipes.models import DataVersion, Feed
+
+re_accepts_gzip = re.compile(r'\bgzip\b')
+re_accepts_br = re.compile(r'\bbr\b')
+
+# fast levels since responses are compressed on the request path (the "publish" command compresses harder offline)
+GZIP_LEVEL = 6
+BROTLI_QUALITY = 5
+# it's not worth compressing really short responses
+COMPRESS_MIN_LENGTH = 200
+
+
+def data_version(request) -> DataVersion:
+    # cached on the request since it's used for both the etag and last modified
+    if not hasattr(request, '_data_version'):
+        request._data_version = DataVersion.current()
+    return request._data_version
+
+
+def accepted_encoding(request) -> str:
+    # preferred encoding the client accepts (ignores q-values just like django's gzip middleware)
+    accept_encoding = request.META.get('HTTP_ACCEPT_ENCODING', '')
+    if re_accepts_br.search(accept_encoding):
+        return 'br'
+    if re_accepts_gzip.search(accept_encoding):
+        return 'gzip'
+    return 'identity'
+
+
+def version_etag(request, version) -> str:
+    # unique per version, url and representation (i.e., content type and encoding)
+    key = '{}:{}:{}:{}'.format(
+        version, request.get_full_path(), request.META.get('HTTP_ACCEPT', ''), accepted_encoding(request))
+    return hashlib.md5(key.encode()).hexdigest()
+
+
+def data_etag(request, *args, **kwargs) -> str:
+    return version_etag(request, data_version(request).version)
+
+
+def data_last_modified(request, *args, **kwargs):
+    return data_version(request).updated
+
+
+def feed_updated(request, name):
+    # when the feed was last built (or None if it doesn't exist) which is cached on the request like the data version
+    if not hasattr(request, '_feed_updated'):
+        request._feed_updated = Feed.objects.filter(name=name).values_list('updated', flat=True).first()
+    return request._feed_updated
+
+
+def feed_version(request, name) -> str:
+    # feeds are also rebuilt independently of the data, e.g., daily to rotate the random feed
+    updated = feed_updated(request, name)
+    return '{}:{}'.format(data_version(request).version, updated.timestamp() if updated else None)
+
+
+def feed_etag(request, name) -> str:
+    return version_etag(request, feed_version(request, name))
+
+
+def feed_last_modified(request, name):
+    return max(filter(None, (data_version(request).updated, feed_updated(request, name))))
+
+
+def query_signature(request, exclude=()) -> str:
+    # canonical signature of the query params, i.e., ignoring their order and the order of repeated values
+    params = sorted((k, sorted(v)) for k, v in request.query_params.lists() if k not in exclude)
+    return hashlib.md5(repr(params).encode()).hexdigest()
+
+
+class ResultIds:
+    """
+    Ordered ids (and search ranks) of a list's results which the paginator slices vs querying every page.
+
+    They're built once per query signature and cached as compact int32/float32 arrays.  At most `limit` ids are kept
+    and pages beyond them are queried.
+    """
+    limit = 10000
+
+    def __init__(self, data: dict, get_queryset):
+        self.data = data
+        self.ids = array('i')
+        self.ids.frombytes(data['ids'])
+        self.ranks = None
+        if data['ranks'] is not None:
+            self.ranks = array('f')
+            self.ranks.frombytes(data['ranks'])
+        # returns the filtered queryset for pages beyond the cached ids
+        self.get_queryset = get_queryset
+
+    @classmethod
+    def build(cls, queryset) -> dict:
+        searched = 'search_rank' in queryset.query.annotations
+        rows = list(queryset.values_list('pk', 'search_rank' if searched else 'pk')[:cls.limit])
+        return {
+            'ids': array('i', [row[0] for row in rows]).tobytes(),
+            'ranks': array('f', [row[1] for row in rows]).tobytes() if searched else None,
+            'count': len(rows) if len(rows) < cls.limit else queryset.count(),
+        }
+
+    def __len__(self):
+        return self.data['count']
+
+    def __getitem__(self, index: slice) -> list:
+        # (id, search rank) pairs
+        if index.stop <= len(self.ids):
+            ids = self.ids[index]
+            ranks = self.ranks[index] if self.ranks is not None else [None] * len(ids)
+            return list(zip(ids, ranks))
+        queryset = self.get_queryset()
+        searched = 'search_rank' in queryset.query.annotations
+        return [
+            (row[0], row[1] if searched else None)
+            for row in queryset.values_list('pk', 'search_rank' if searched else 'pk')[index]
+        ]
+
+
+def compress(content: bytes, encoding: str) -> bytes:
+    if encoding == 'br':
+        return brotli.compress(content, quality=BROTLI_QUALITY)
+    return gzip.compress(content, compresslevel=GZIP_LEVEL)
+
+
+def gzip_response(request, response):
+    # compress a response which isn't cached on the fly
+    return gzip_page(lambda *args, **kwargs: response)(request)
+
+
+def cache_compressed(timeout: int, version_func=None):
+    """
+    Caches successful GET responses alongside their compressed gzip and brotli variants.
+
+    Each variant is compressed the first time a client accepts it and is cached alongside the response so every later
+    hit is served without compressing again.
+    The cache is keyed by the data version, url and content type so it's invalidated when the data version is bumped.
+    Views can key their responses by another version with `version_func(request, *args, **kwargs)`.
+
+    Requests which aren't cached (e.g., writes and logged-in users) are compressed on the fly using `gzip_page`.
+    """
+    def decorator(view_func):
+
+        @wraps(view_func)
+        def _wrapped_view(request, *args, **kwargs):
+            if request.method not in ('GET', 'HEAD') or settings.SESSION_COOKIE_NAME in request.COOKIES:
+                return gzip_response(request, view_func(request, *args, **kwargs))
+
+            version = version_func(request, *args, **kwargs) if version_func else data_version(request).version
+            key = 'response:{}'.format(hashlib.md5('{}:{}:{}'.format(
+                version, request.build_absolute_uri(), request.META.get('HTTP_ACCEPT', ''),
+            ).encode()).hexdigest())
+            cached = cache.get(key)
+            changed = cached is None
+
+            if cached is None:
+                response = view_func(request, *args, **kwargs)
+                if response.status_code != 200 or response.streaming or response.has_header('Content-Encoding'):
+                    return gzip_response(request, response)
+                if callable(getattr(response, 'render', None)):
+                    response.render()
+                patch_response_headers(response, timeout)
+                cached = {
+                    'headers': {k: v for k, v in response.items() if k not in ('Content-Length', 'Content-Encoding')},
+                    'variants': {'identity': response.content},
+                }
+
+            encoding = accepted_encoding(request)
+            if len(cached['variants']['identity']) < COMPRESS_MIN_LENGTH:
+                encoding = 'identity'
+            elif encoding not in cached['variants']:
+                # only the encodings clients actually accept are compressed
+                cached['variants'][encoding] = compress(cached['variants']['identity'], encoding)
+                changed = True
+            if changed:
+                cache.set(key, cached, timeout)
+
+            response = HttpResponse(cached['variants'][encoding])
+            for header, value in cached['headers'].items():
+                response[header] = value
+            if encoding != 'identity':
+                response['Content-Encoding'] = encoding
+            response['Content-Length'] = str(len(response.content))
+            patch_vary_headers(response, ('Accept-Encoding',))
+            return response
+
+        return _wrapped_view
+
+    return decorator
@@ -1,13 +1,14 @@
-from functools import reduce
-
 from django.contrib.postgres.aggregates import ArrayAgg
-from django.contrib.postgres.search import SearchRank, SearchQuery
-from django.db.models import F
-from rest_framework.filters import SearchFilter
+from django.contrib.postgres.search import SearchHeadline, SearchRank, SearchQuery
+from django.db.models import F, Func, Value
+from rest_framework.filters import OrderingFilter, SearchFilter
 from django_filters import rest_framework as filters, ModelMultipleChoiceFilter
 
 from recipe_api.settings import POSTGRES_LANGUAGE_UNACCENT
-from recipes.models import Recipe, Category
+from recipes.models import Recipe, Category, RecipeSearch
+
+# default ordering by popularity (and then newest as a tie-breaker) which matches the popularity indexes
+RECIPE_ORDERING = ('-popularity', '-pk')
 
 
 class RecipeFilter(filters.FilterSet):
@@ -15,6 +16,7 @@ class RecipeFilter(filters.FilterSet):
         queryset=Category.objects.all(),
         method='filter_categories',
     )
+    collapse_duplicates = filters.BooleanFilter(method='filter_collapse_duplicates')
 
     def filter_categories(self, queryset, name, value):
         # custom filter to guarantee recipes only appear when they
@@ -26,13 +28,15 @@ class RecipeFilter(filters.FilterSet):
         queryset = queryset.filter(cats__contains=[c.id for c in categories])
         return queryset
 
+    def filter_collapse_duplicates(self, queryset, name, value):
+        # only the originals of near-duplicate recipes (see the "dedupe" command)
+        if not value:
+            return queryset
+        return queryset.filter(duplicate_of__isnull=True)
+
     def filter_queryset(self, queryset):
-        # order by existing fields and then rating with nulls last
-        return super().filter_queryset(queryset).order_by(
-            *queryset.query.order_by,
-            F('rating_value').desc(nulls_last=True),
-            '-rating_count',
-        )
+        # order by existing fields and then popularity
+        return super().filter_queryset(queryset).order_by(*queryset.query.order_by, *RECIPE_ORDERING)
 
     class Meta:
         model = Recipe
@@ -44,6 +48,19 @@ class RecipeFilter(filters.FilterSet):
         }
 
 
+class RecipeSearchFilter(RecipeFilter):
+
+    def filter_categories(self, queryset, name, value):
+        # categories are denormalized into an indexed array so there's no need to aggregate
+        categories = value
+        if not categories:
+            return queryset
+        return queryset.filter(category_ids__contains=[c.id for c in categories])
+
+    class Meta(RecipeFilter.Meta):
+        model = RecipeSearch
+
+
 class SearchVectorFilter(SearchFilter):
     """
     Sub-classing `SearchFilter` to enable full-text search capabilities of postgres when a search vector is defined.
@@ -51,27 +68,65 @@ class SearchVectorFilter(SearchFilter):
     For example, if there is a SearchVectorField defined as "search_vector" then this search filter
     will directly filter the vector like the following:
 
-        Recipe.objects.filter(search_vector='cheeses')
+        Recipe.objects.filter(search_vector=SearchQuery('cheeses', search_type='websearch'))
+
+    The search is compiled into a single tsquery using web search syntax, i.e., "quoted phrases", "or" and "-negation".
 
     Results are ordered by search rank.
+
+    Ranking is bounded for broad searches: at most `candidate_limit` matches are selected using the search vector's
+    index, pre-ordered by the explicit "?ordering=" (if any) and then the existing (popularity) ordering, and only those
+    candidates are ranked.  The unbounded matches are stored on the request as `search_matches` so an approximate total
+    can be reported.
+
+    Highlighted snippets (`ts_headline`) of the name, description and matching ingredients are optionally included with
+    "?highlight=1".  They're expensive so they're only computed for the current page (see `get_highlights()`).
     """
     search_vector_field_name = 'search_vector'
+    candidate_limit = 1000
+    highlight_param = 'highlight'
+    highlight_options = {'start_sel': '<mark>', 'stop_sel': '</mark>', 'config': POSTGRES_LANGUAGE_UNACCENT}
 
     # TODO - implement trigram search
 
-    def filter_queryset(self, request, queryset, view):
-        queryset = super().filter_queryset(request, queryset, view)
-        # build combined search queries
-        search_queries = [SearchQuery(term, config=POSTGRES_LANGUAGE_UNACCENT) for term in self.get_search_terms(request)]
-        if search_queries:
-            search_query = reduce(lambda x, y: x & y, search_queries)
-            # include and order by search rank
-            queryset = queryset.model.objects.annotate(search_rank=SearchRank(F('search_vector'), search_query))
-            queryset = queryset.filter(search_vector=search_query)
-            queryset = queryset.order_by('-search_rank')
-        return queryset
+    def get_search_query(self, request):
+        search = request.query_params.get(self.search_param, '').replace('\x00', '').strip()
+        if not search:
+            return None
+        return SearchQuery(search, search_type='websearch', config=POSTGRES_LANGUAGE_UNACCENT)
 
-    def construct_search(self, field_name):
-        if field_name == self.search_vector_field_name:
-            return field_name
-        return super().construct_search(field_name)
+    def get_highlights(self, request) -> dict:
+        # highlight annotations for the recipes of the current page (i.e., after pagination)
+        search_query = self.get_search_query(request)
+        if search_query is None or request.query_params.get(self.highlight_param) not in ('1', 'true'):
+            return {}
+        return {
+            'name_highlight': SearchHeadline('name', search_query, highlight_all=True, **self.highlight_options),
+            'description_highlight': SearchHeadline('description', search_query, **self.highlight_options),
+            'ingredients_highlight': SearchHeadline(
+                Func(F('ingredients'), Value(' | '), function='array_to_string'), search_query,
+                max_fragments=3, fragment_delimiter=' ... ', **self.highlight_options),
+        }
+
+    def get_explicit_ordering(self, request, queryset, view) -> list:
+        # the valid "?ordering=" fields which `OrderingFilter` will re-sort the results by
+        params = request.query_params.get(OrderingFilter.ordering_param)
+        if not params:
+            return []
+        fields = [param.strip() for param in params.split(',')]
+        return OrderingFilter().remove_invalid_fields(queryset, fields, view, request)
+
+    def filter_queryset(self, request, queryset, view):
+        search_query = self.get_search_query(request)
+        if search_query is None:
+            return queryset
+        ordering = queryset.query.order_by
+        matches = queryset.filter(**{self.search_vector_field_name: search_query})
+        request.search_matches = matches
+        # bounded candidates which are cheaply selected from the search vector index
+        explicit_ordering = self.get_explicit_ordering(request, queryset, view)
+        candidates = matches.order_by(*explicit_ordering, *ordering)[:self.candidate_limit]
+        # include and order by search rank (only computed for the candidates)
+        queryset = queryset.filter(pk__in=candidates.values('pk'))
+        queryset = queryset.annotate(search_rank=SearchRank(F(self.search_vector_field_name), search_query))
+        return queryset.order_by('-search_rank', *ordering)
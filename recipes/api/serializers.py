@@ -10,10 +10,17 @@ class CategorySerializer(serializers.ModelSerializer):
 
 class RecipeSerializer(serializers.ModelSerializer):
     search_rank = serializers.FloatField(read_only=True)
+    coverage = serializers.FloatField(read_only=True)
+    missing_count = serializers.IntegerField(read_only=True)
+    similarity = serializers.FloatField(read_only=True)
+    name_highlight = serializers.CharField(read_only=True)
+    description_highlight = serializers.CharField(read_only=True)
+    ingredients_highlight = serializers.CharField(read_only=True)
 
     class Meta:
         model = Recipe
-        exclude = ('search_vector',)
+        # derived columns which are only used for searching, ordering and filtering
+        exclude = ('search_vector', 'minhash', 'popularity', 'duplicate_of', 'updated_at',)
 
 
 class JustTheRecipeSerializer(serializers.Serializer):
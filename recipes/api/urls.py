@@ -7,6 +7,11 @@ router.register('category', viewsets.CategoryViewSet)
 router.register('recipe', viewsets.RecipeViewSet)
 
 urlpatterns = [
+    # before the router so "slug" and "changes" aren't treated as recipe ids
+    path(r'recipe/slug/<slug:slug>/', views.RecipeDetailView.as_view(), name='recipe-slug'),
+    path(r'recipe/changes/', views.RecipeChangesView.as_view(), name='recipe-changes'),
     path('', include(router.urls)),
     path(r'just-the-recipe/', views.JustTheRecipeView.as_view(), name='just-the-recipe'),
+    path(r'export/', views.RecipeExportView.as_view(), name='export'),
+    path(r'feed/<slug:name>/', views.FeedView.as_view(), name='feed'),
 ]
@@ -1,19 +1,34 @@
 import requests
+from django.core.cache import cache
+from django.db import router
+from django.db.models import Q
+from django.db.models.expressions import RawSQL
+from django.http import StreamingHttpResponse
+from django.shortcuts import get_object_or_404
+from django.utils.dateparse import parse_date
 from django.utils.decorators import method_decorator
 from django.views.decorators.cache import cache_page
+from django.views.decorators.gzip import gzip_page
+from django.views.decorators.http import condition
+from rest_framework.generics import GenericAPIView, RetrieveAPIView
 from rest_framework.permissions import AllowAny
 from rest_framework.exceptions import ValidationError
 from rest_framework.response import Response
 from rest_framework.views import APIView
-from recipe_scrapers import scrape_html
 
-from recipes.api.serializers import JustTheRecipeSerializer
+from recipes.api.caching import cache_compressed, feed_etag, feed_last_modified, feed_version
+from recipes.api.serializers import JustTheRecipeSerializer, RecipeSerializer
+from recipes.export import export_recipes, gzip_stream
+from recipes.models import Feed, Recipe, RecipeChange
+from recipes.signals import recipe_cache_key
 
 CACHE_MINUTE = 60
 CACHE_HOUR = CACHE_MINUTE * 60
 CACHE_HALF_DAY = CACHE_HOUR * 12
 CACHE_DAY = CACHE_HALF_DAY * 2
 
+CHANGES_LIMIT = 500
+
 # TODO - rate limit
 # https://django-ratelimit.readthedocs.io/en/stable/
 
@@ -50,6 +65,8 @@ class JustTheRecipeView(APIView):
                 'content': req.content,
             })
         html = req.content
+        # imported on first use since it's slow to import and rarely used
+        from recipe_scrapers import scrape_html
         # pass the html alongside the url to our scrape_html function
         try:
             scraper = scrape_html(html, org_url=url, wild_mode=True)
@@ -61,3 +78,112 @@ class JustTheRecipeView(APIView):
         # return serialized version
         recipe = JustTheRecipeSerializer(scraper.to_json(), many=False).data
         return Response(recipe)
+
+
+class RecipeExportView(APIView):
+    """
+    Streams every recipe, with its category names, as gzipped NDJSON.
+
+    Optionally only includes recipes added since a date, e.g., "?since=2024-01-31".
+    """
+    permission_classes = (AllowAny,)
+
+    def get(self, request):
+        since = None
+        if 'since' in request.GET:
+            try:
+                since = parse_date(request.GET['since'])
+            except ValueError:  # well formatted but not a valid date, e.g., "2024-02-30"
+                since = None
+            if not since:
+                raise ValidationError({'since': "Invalid 'since' parameter"})
+        response = StreamingHttpResponse(gzip_stream(export_recipes(since=since)), content_type='application/gzip')
+        response['Content-Disposition'] = 'attachment; filename="recipes.ndjson.gz"'
+        return response
+
+
+@method_decorator(condition(etag_func=feed_etag, last_modified_func=feed_last_modified), name='dispatch')
+@method_decorator(cache_compressed(timeout=CACHE_DAY, version_func=feed_version), name='dispatch')
+class FeedView(GenericAPIView):
+    """
+    Pages through a precomputed discovery feed, e.g., "top-rated", "newest", "random" or "category-{id}".
+
+    Only the recipes on the requested page are fetched.  Responses are cached until the feed is rebuilt or the data
+    version is bumped.
+    """
+    permission_classes = (AllowAny,)
+    serializer_class = RecipeSerializer
+
+    def get(self, request, name):
+        feed = get_object_or_404(Feed, name=name)
+        page = self.paginate_queryset(feed.recipe_ids)
+        recipes = Recipe.objects.hydrate(page)
+        serializer = self.get_serializer(recipes, many=True)
+        return self.get_paginated_response(serializer.data)
+
+
+class RecipeDetailView(RetrieveAPIView):
+    """
+    A single recipe by its slug.
+
+    The serialized recipe is cached until the scraper or admin changes it (see recipes/signals.py) rather than
+    until the next data version like the rest of the api.
+    """
+    permission_classes = (AllowAny,)
+    serializer_class = RecipeSerializer
+    lookup_field = 'slug'
+
+    def get_queryset(self):
+        # the cache is filled from the primary since a lagging replica would cache a stale recipe until it changes again
+        return Recipe.objects.using(router.db_for_write(Recipe)).prefetch_related('categories')
+
+    @method_decorator(gzip_page)
+    def get(self, request, slug):
+        key = recipe_cache_key(slug)
+        data = cache.get(key)
+        if data is None:
+            data = dict(self.get_serializer(self.get_object()).data)
+            cache.set(key, data, CACHE_DAY)
+        return Response(data)
+
+
+class RecipeChangesView(GenericAPIView):
+    """
+    Incremental sync: recipes changed and deleted (tombstones) since the "since" cursor of the previous response.
+
+    Changes are paged in (transaction id, id) order and only include transactions older than every transaction
+    still in progress, so a change which commits later can never be behind the returned cursor.
+
+    It's not cached like the rest of the api since the log changes with every write rather than every data version.
+    """
+    permission_classes = (AllowAny,)
+    serializer_class = RecipeSerializer
+
+    @method_decorator(gzip_page)
+    def get(self, request):
+        since = request.query_params.get('since', '0-0')
+        try:
+            since_transaction, since_id = (int(v) for v in since.split('-'))
+        except ValueError:
+            raise ValidationError({'since': "Invalid 'since' parameter"})
+
+        changes = list(RecipeChange.objects.filter(
+            Q(transaction_id__gt=since_transaction) | Q(transaction_id=since_transaction, id__gt=since_id),
+            transaction_id__lt=RawSQL('txid_snapshot_xmin(txid_current_snapshot())', []),
+        ).order_by('transaction_id', 'id')[:CHANGES_LIMIT + 1])
+        has_more = len(changes) > CHANGES_LIMIT
+        changes = changes[:CHANGES_LIMIT]
+
+        # only the latest change of each recipe in this page
+        latest = {}
+        for change in changes:
+            latest.pop(change.recipe_id, None)
+            latest[change.recipe_id] = change
+        recipes = Recipe.objects.hydrate([recipe_id for recipe_id, change in latest.items() if not change.deleted])
+
+        return Response({
+            'cursor': '{}-{}'.format(changes[-1].transaction_id, changes[-1].id) if changes else since,
+            'has_more': has_more,
+            'changed': self.get_serializer(recipes, many=True).data,
+            'deleted': [{'id': c.recipe_id, 'slug': c.slug} for c in latest.values() if c.deleted],
+        })
@@ -1,21 +1,39 @@
+from django.core.cache import cache
+from django.db import router
+from django.http import Http404
 from django.utils.decorators import method_decorator
-from django.views.decorators.cache import cache_page
-from django.views.decorators.gzip import gzip_page
+from django.views.decorators.http import condition
 from django_filters.rest_framework import DjangoFilterBackend
 from rest_framework import viewsets
+from rest_framework.decorators import action
+from rest_framework.exceptions import ValidationError
 from rest_framework.filters import OrderingFilter
+from rest_framework.response import Response
 
-from recipes.api.filters import SearchVectorFilter, RecipeFilter
+from recipes.api.caching import (
+    ResultIds, cache_compressed, data_etag, data_last_modified, data_version, query_signature,
+)
+from recipes.api.filters import SearchVectorFilter, RecipeFilter, RecipeSearchFilter
 from recipes.api.serializers import CategorySerializer, RecipeSerializer
-from recipes.models import Category, Recipe
+from recipes.index import pantry_index, similar_index, spelling_index
+from recipes.models import Category, Recipe, RecipeSearch
+from recipes.queries import estimate_count
+from recipes.signals import recipe_cache_key
 
 
 CACHE_HOUR = 60 * 60
 CACHE_DAY = CACHE_HOUR * 24
 
+SIMILAR_LIMIT_DEFAULT = 10
+SIMILAR_LIMIT_MAX = 50
 
-@method_decorator(gzip_page, name='dispatch')
-@method_decorator(cache_page(timeout=CACHE_DAY), name='dispatch')
+BATCH_LIMIT = 50
+
+RESULT_IDS_TIMEOUT = CACHE_HOUR
+
+
+@method_decorator(condition(etag_func=data_etag, last_modified_func=data_last_modified), name='dispatch')
+@method_decorator(cache_compressed(timeout=CACHE_DAY), name='dispatch')
 class CategoryViewSet(viewsets.ModelViewSet):
     queryset = Category.objects.all()
     serializer_class = CategorySerializer
@@ -24,12 +42,122 @@ class CategoryViewSet(viewsets.ModelViewSet):
     pagination_class = None
 
 
-@method_decorator(gzip_page, name='dispatch')
-@method_decorator(cache_page(timeout=CACHE_DAY), name='dispatch')
+@method_decorator(condition(etag_func=data_etag, last_modified_func=data_last_modified), name='dispatch')
+@method_decorator(cache_compressed(timeout=CACHE_DAY), name='dispatch')
 class RecipeViewSet(viewsets.ModelViewSet):
     queryset = Recipe.objects.all()
     serializer_class = RecipeSerializer
-    filterset_class = RecipeFilter
-    filter_backends = (SearchVectorFilter, DjangoFilterBackend, OrderingFilter)
+    # NOTE: searching comes after filtering so the bounded search candidates honor the filters
+    filter_backends = (DjangoFilterBackend, SearchVectorFilter, OrderingFilter)
     search_fields = ['search_vector']
-    ordering_fields = ['rating_value', 'date_added']
+    ordering_fields = ['popularity', 'rating_value', 'date_added']
+
+    @property
+    def filterset_class(self):
+        return RecipeSearchFilter if self.action == 'list' else RecipeFilter
+
+    def get_queryset(self):
+        # lists are searched, filtered and ordered using the narrow search table
+        if self.action == 'list':
+            return RecipeSearch.objects.all()
+        return super().get_queryset()
+
+    def get_results(self, request) -> ResultIds:
+        # ordered result ids cached per query signature (and data version) so paging doesn't search and sort again
+        signature = query_signature(request, exclude=(self.paginator.page_query_param, SearchVectorFilter.highlight_param))
+        key = 'result-ids:{}:{}'.format(data_version(request).version, signature)
+        data = cache.get(key)
+        if data is None:
+            data = ResultIds.build(self.filter_queryset(self.get_queryset()))
+            search_matches = getattr(request, 'search_matches', None)
+            data['searched'] = search_matches is not None
+            # report an approximate total when search ranking was bounded
+            if search_matches is not None and data['count'] >= SearchVectorFilter.candidate_limit:
+                data['approximate_count'] = max(estimate_count(search_matches), data['count'])
+            cache.set(key, data, RESULT_IDS_TIMEOUT)
+        return ResultIds(data, lambda: self.filter_queryset(self.get_queryset()))
+
+    def list(self, request, *args, **kwargs):
+        # paginate the ordered result ids and then only fetch the full recipes for the current page
+        results = self.get_results(request)
+        page = self.paginate_queryset(results)
+        highlights = SearchVectorFilter().get_highlights(request)
+        recipes = Recipe.objects.annotate(**highlights).hydrate([recipe_id for recipe_id, _ in page])
+        search_ranks = {recipe_id: search_rank for recipe_id, search_rank in page if search_rank is not None}
+        for recipe in recipes:
+            if recipe.id in search_ranks:
+                recipe.search_rank = search_ranks[recipe.id]
+        serializer = self.get_serializer(recipes, many=True)
+        response = self.get_paginated_response(serializer.data)
+        if 'approximate_count' in results.data:
+            response.data['approximate_count'] = results.data['approximate_count']
+        # "did you mean" for searches without any results
+        if results.data['searched'] and response.data['count'] == 0:
+            suggestion = spelling_index.suggest(request.query_params[SearchVectorFilter.search_param])
+            if suggestion:
+                response.data['suggestion'] = suggestion
+        return response
+
+    @action(detail=False)
+    def pantry(self, request):
+        # "cook with what I have" - rank recipes by how many of their ingredients are covered by the supplied pantry
+        pantry = [i for i in request.query_params.get('ingredients', '').split(',') if i.strip()]
+        if not pantry:
+            raise ValidationError({'ingredients': "Missing 'ingredients' parameter"})
+        # only the requested page of matches is ordered
+        page = self.paginate_queryset(pantry_index.rank(pantry))
+        scores = {recipe_id: (recipe_coverage, recipe_missing) for recipe_id, recipe_coverage, recipe_missing in page}
+        recipes = Recipe.objects.hydrate(list(scores))
+        for recipe in recipes:
+            recipe.coverage, recipe.missing_count = scores[recipe.id]
+        serializer = self.get_serializer(recipes, many=True)
+        return self.get_paginated_response(serializer.data)
+
+    @action(detail=True)
+    def similar(self, request, pk=None):
+        # top-k recipes by cosine similarity of their precomputed vectors
+        try:
+            limit = min(int(request.query_params.get('limit', SIMILAR_LIMIT_DEFAULT)), SIMILAR_LIMIT_MAX)
+        except ValueError:
+            raise ValidationError({'limit': "Invalid 'limit' parameter"})
+        similar = similar_index.similar(int(pk), limit) if pk.isascii() and pk.isdigit() else None
+        if similar is None:
+            raise Http404
+        recipe_ids, scores = similar
+        similarities = dict(zip(recipe_ids.tolist(), scores.tolist()))
+        recipes = Recipe.objects.hydrate(list(similarities))
+        for recipe in recipes:
+            recipe.similarity = similarities[recipe.id]
+        serializer = self.get_serializer(recipes, many=True)
+        return Response(serializer.data)
+
+    @action(detail=False)
+    def batch(self, request):
+        # multiple recipes by "?slugs=a,b" or "?ids=1,2" in the requested order (missing recipes are skipped)
+        if 'slugs' in request.query_params:
+            field = 'slug'
+            values = [v.strip() for v in request.query_params['slugs'].split(',') if v.strip()]
+        elif 'ids' in request.query_params:
+            field = 'id'
+            values = [v.strip() for v in request.query_params['ids'].split(',') if v.strip()]
+            if not all(v.isascii() and v.isdigit() for v in values):
+                raise ValidationError({'ids': "Invalid 'ids' parameter"})
+            values = [str(int(v)) for v in values]
+        else:
+            raise ValidationError({'slugs': "Missing 'slugs' or 'ids' parameter"})
+        if len(values) > BATCH_LIMIT:
+            raise ValidationError({field + 's': 'At most {} recipes can be requested'.format(BATCH_LIMIT)})
+        values = list(dict.fromkeys(values))
+
+        # serialized recipes are cached individually, like the recipe detail, until they change (see recipes/signals.py)
+        keys = {value: recipe_cache_key(value, field) for value in values}
+        cached = cache.get_many(list(keys.values()))
+        missing = [value for value in values if keys[value] not in cached]
+        if missing:
+            # filled from the primary since a lagging replica would cache a stale recipe until it changes again
+            recipes = Recipe.objects.using(router.db_for_write(Recipe)).filter(
+                **{'{}__any'.format(field): missing}).prefetch_related('categories')
+            fetched = {keys[str(getattr(recipe, field))]: dict(self.get_serializer(recipe).data) for recipe in recipes}
+            cache.set_many(fetched, CACHE_DAY)
+            cached.update(fetched)
+        return Response([cached[keys[value]] for value in values if keys[value] in cached])
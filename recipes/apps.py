@@ -3,3 +3,7 @@ from django.apps import AppConfig
 
 class RecipesConfig(AppConfig):
     name = 'recipes'
+
+    def ready(self):
+        # register custom lookups and signal handlers
+        from recipes import lookups, signals  # noqa: F401
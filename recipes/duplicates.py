@@ -0,0 +1,85 @@
+import zlib
+
+import numpy as np
+
+from recipes.index import normalize_tokens, recipe_ingredients
+
+# 128 hashes split into 16 bands of 8 rows which makes recipes with a jaccard similarity above ~0.7 likely candidates
+MINHASH_PERMUTATIONS = 128
+LSH_BANDS = 16
+# candidates are only duplicates when their estimated jaccard similarity is above the threshold
+DUPLICATE_THRESHOLD = 0.8
+# instructions are shingled into overlapping word n-grams
+SHINGLE_SIZE = 3
+
+_PRIME = np.uint64((1 << 32) - 5)
+_rng = np.random.default_rng(0)
+_A = _rng.integers(1, _PRIME, MINHASH_PERMUTATIONS, dtype=np.uint64)
+_B = _rng.integers(0, _PRIME, MINHASH_PERMUTATIONS, dtype=np.uint64)
+
+
+def recipe_shingles(ingredients: list, instructions: list) -> set:
+    # each normalized ingredient (ignoring quantities) and word n-grams of the normalized instructions
+    shingles = {'i:' + ' '.join(sorted(set(normalize_tokens(i)))) for i in recipe_ingredients(ingredients)}
+    words = normalize_tokens(' '.join(instructions or []))
+    shingles.update('s:' + ' '.join(words[i:i + SHINGLE_SIZE]) for i in range(max(len(words) - SHINGLE_SIZE + 1, 1)))
+    shingles.discard('i:')
+    shingles.discard('s:')
+    return shingles
+
+
+def recipe_minhash(ingredients: list, instructions: list):
+    """
+    MinHash signature of a recipe's normalized ingredients and instructions as `MINHASH_PERMUTATIONS` uint32s
+    (512 bytes) or None if the recipe doesn't have any content.
+    """
+    shingles = recipe_shingles(ingredients, instructions)
+    if not shingles:
+        return None
+    hashes = np.array([zlib.crc32(s.encode()) for s in shingles], dtype=np.uint64)
+    # universal hashing (a * x + b) mod p for every permutation and shingle, i.e., a (permutations x shingles) matrix
+    signature = ((_A[:, None] * hashes[None, :] + _B[:, None]) % _PRIME).min(axis=1)
+    return signature.astype(np.uint32).tobytes()
+
+
+def duplicate_clusters(signatures: dict) -> list:
+    """
+    Clusters of near-duplicate recipe ids given their MinHash signatures (recipe id => signature bytes).
+
+    Locality sensitive hashing buckets the recipes by each band of their signature so only recipes sharing a bucket
+    are compared, i.e., roughly linear vs comparing every pair.  Candidates above `DUPLICATE_THRESHOLD` are merged
+    into clusters with union-find.
+    """
+    recipe_ids = list(signatures)
+    if not recipe_ids:
+        return []
+    matrix = np.frombuffer(b''.join(signatures[i] for i in recipe_ids), dtype=np.uint32).reshape(len(recipe_ids), -1)
+    rows = matrix.shape[1] // LSH_BANDS
+
+    parents = list(range(len(recipe_ids)))
+
+    def find(i):
+        while parents[i] != i:
+            parents[i] = parents[parents[i]]
+            i = parents[i]
+        return i
+
+    for band in range(LSH_BANDS):
+        buckets = {}
+        for i, key in enumerate(np.ascontiguousarray(matrix[:, band * rows:(band + 1) * rows])):
+            buckets.setdefault(key.tobytes(), []).append(i)
+        for bucket in buckets.values():
+            # compare each recipe with one representative of every cluster already found in the bucket
+            representatives = []
+            for i in bucket:
+                for representative in representatives:
+                    if np.mean(matrix[i] == matrix[representative]) >= DUPLICATE_THRESHOLD:
+                        parents[find(i)] = find(representative)
+                        break
+                else:
+                    representatives.append(i)
+
+    clusters = {}
+    for i in range(len(recipe_ids)):
+        clusters.setdefault(find(i), []).append(recipe_ids[i])
+    return [cluster for cluster in clusters.values() if len(cluster) > 1]
@@ -0,0 +1,48 @@
+import json
+import zlib
+
+from django.contrib.postgres.aggregates import ArrayAgg
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import Q
+
+from recipes.models import Recipe
+
+EXPORT_FIELDS = (
+    'id', 'slug', 'name', 'image_path', 'description', 'total_time_string', 'servings', 'rating_value',
+    'rating_count', 'ingredients', 'instructions', 'author', 'date_added',
+)
+EXPORT_CHUNK_SIZE = 1000
+GZIP_LEVEL = 6
+# compress in blocks vs every line
+GZIP_BLOCK_SIZE = 64 * 1024
+
+
+def export_recipes(since=None):
+    """
+    Yields every recipe, with its category names, as a line of json (NDJSON).
+
+    Recipes are read in chunks using a server-side cursor so memory stays constant regardless of the corpus size.
+    """
+    recipes = Recipe.objects.annotate(
+        category_names=ArrayAgg('categories__name', ordering='categories__name', filter=Q(categories__isnull=False)),
+    ).values(*EXPORT_FIELDS, 'category_names').order_by('id')
+    if since:
+        recipes = recipes.filter(date_added__gte=since)
+    for recipe in recipes.iterator(chunk_size=EXPORT_CHUNK_SIZE):
+        recipe['categories'] = recipe.pop('category_names') or []
+        yield json.dumps(recipe, cls=DjangoJSONEncoder) + '\n'
+
+
+def gzip_stream(lines):
+    # gzip the lines as a stream
+    compressor = zlib.compressobj(GZIP_LEVEL, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    block = []
+    block_size = 0
+    for line in lines:
+        block.append(line.encode())
+        block_size += len(block[-1])
+        if block_size >= GZIP_BLOCK_SIZE:
+            yield compressor.compress(b''.join(block))
+            block = []
+            block_size = 0
+    yield compressor.compress(b''.join(block)) + compressor.flush()
@@ -0,0 +1,41 @@
+import datetime
+
+from django.db import transaction
+from django.db.models.expressions import RawSQL
+
+from recipes.api.filters import RECIPE_ORDERING
+from recipes.models import Category, Feed, RecipeSearch
+
+# most recipes anyone pages through
+FEED_SIZE = 1000
+# number of ratings before a recipe is considered "top rated" so a single 5 star rating doesn't top the feed
+FEED_MIN_RATING_COUNT = 10
+RANDOM_FEED_SIZE = 100
+
+
+def feed_querysets(today: datetime.date) -> dict:
+    # name => ordered queryset of the search table for every feed
+    # near-duplicates would crowd the feeds
+    recipes = RecipeSearch.objects.filter(duplicate_of__isnull=True)
+    feeds = {
+        'top-rated': recipes.filter(rating_count__gte=FEED_MIN_RATING_COUNT).order_by(*RECIPE_ORDERING),
+        'newest': recipes.order_by('-date_added', '-recipe_id'),
+        # the same sample all day by hashing the ids with the date
+        'random': recipes.order_by(RawSQL('md5(recipe_id::text || %s)', [today.isoformat()]))[:RANDOM_FEED_SIZE],
+    }
+    for category_id in Category.objects.values_list('id', flat=True):
+        feeds['category-{}'.format(category_id)] = recipes.filter(
+            category_ids__contains=[category_id]).order_by(*RECIPE_ORDERING)
+    return feeds
+
+
+def build_feeds(today: datetime.date = None) -> int:
+    # replaces every feed in a single transaction so readers never see a partial set
+    feeds = [
+        Feed(name=name, recipe_ids=list(queryset.values_list('recipe_id', flat=True)[:FEED_SIZE]))
+        for name, queryset in feed_querysets(today or datetime.date.today()).items()
+    ]
+    with transaction.atomic():
+        Feed.objects.all().delete()
+        Feed.objects.bulk_create(feeds)
+    return len(feeds)
@@ -0,0 +1,384 @@
+import os
+import re
+import threading
+import unicodedata
+
+import numpy as np
+from django.contrib.postgres.aggregates import ArrayAgg
+from django.db import connection
+
+from recipe_api.settings import INDEX_DIR
+from recipes.models import Recipe
+
+# ingredient group headers are stored inline as "@@group@@" (see the scrape command)
+RE_INGREDIENT_GROUP = re.compile(r'^@@.*@@$')
+RE_TOKEN = re.compile(r'[a-z]+')
+RE_WORD = re.compile(r'[^\W\d_]+')
+
+STOP_WORDS = {'a', 'an', 'and', 'of', 'or', 'the', 'to'}
+
+
+def singularize(token: str) -> str:
+    # naive plural stripping which is good enough to match "tomatoes" with "tomato" and "berries" with "berry"
+    if len(token) <= 3 or token.endswith('ss'):
+        return token
+    if token.endswith('ies'):
+        return token[:-3] + 'y'
+    if token.endswith('oes'):
+        return token[:-2]
+    if token.endswith('s'):
+        return token[:-1]
+    return token
+
+
+def strip_accents(text: str) -> str:
+    return unicodedata.normalize('NFKD', text).encode('ascii', 'ignore').decode()
+
+
+def normalize_tokens(text: str) -> list:
+    # lowercase, strip accents and drop quantities, punctuation and stop words
+    text = strip_accents(text).lower()
+    return [singularize(t) for t in RE_TOKEN.findall(text) if len(t) > 1 and t not in STOP_WORDS]
+
+
+def recipe_ingredients(ingredients: list) -> list:
+    # ingredient lines without the group headers
+    return [i for i in ingredients or [] if not RE_INGREDIENT_GROUP.match(i)]
+
+
+class FileIndex:
+    """
+    Index which is built after scraping and saved in `INDEX_DIR` so every api worker can load it.
+
+    The file is lazily (re)loaded whenever it's replaced on disk, i.e., after the next build.
+    """
+    file_name = None
+
+    def __init__(self):
+        self._data = None
+        self._mtime = None
+        self._lock = threading.Lock()
+
+    @property
+    def path(self) -> str:
+        return os.path.join(INDEX_DIR, self.file_name)
+
+    def get(self):
+        # returns the loaded index or None if it hasn't been built yet
+        try:
+            mtime = os.stat(self.path).st_mtime
+        except FileNotFoundError:
+            return None
+        if mtime != self._mtime:
+            with self._lock:
+                if mtime != self._mtime:
+                    self._data = self.load(self.path)
+                    self._mtime = mtime
+        return self._data
+
+    def build(self):
+        os.makedirs(INDEX_DIR, exist_ok=True)
+        # write to a temporary file and swap it in so workers never load a partial index
+        path_tmp = '{}.tmp'.format(self.path)
+        with open(path_tmp, 'wb') as fp:
+            self.write(fp)
+        os.replace(path_tmp, self.path)
+
+    def write(self, fp):
+        raise NotImplementedError
+
+    def load(self, path):
+        raise NotImplementedError
+
+
+class PantryIndex(FileIndex):
+    """
+    Inverted index of normalized ingredient tokens to ingredient lines.
+
+    A pantry item matches an ingredient line when all its tokens are in the line, e.g., "chicken thigh" matches
+    "8 bone-in, skin-on chicken thighs".  Recipes are ranked by coverage, i.e., the fraction of their ingredients
+    matched by the pantry, and then by how many ingredients are missing.
+    """
+    file_name = 'pantry.npz'
+
+    def write(self, fp):
+        recipe_ids = []
+        ingredient_counts = []
+        line_recipes = []
+        postings = {}
+
+        for recipe_id, ingredients in Recipe.objects.values_list('id', 'ingredients').iterator(chunk_size=2000):
+            ingredients = recipe_ingredients(ingredients)
+            if not ingredients:
+                continue
+            recipe_index = len(recipe_ids)
+            recipe_ids.append(recipe_id)
+            ingredient_counts.append(len(ingredients))
+            for ingredient in ingredients:
+                line = len(line_recipes)
+                line_recipes.append(recipe_index)
+                for token in set(normalize_tokens(ingredient)):
+                    postings.setdefault(token, []).append(line)
+
+        tokens = sorted(postings)
+        offsets = np.cumsum([0] + [len(postings[t]) for t in tokens])
+        np.savez(
+            fp,
+            recipe_ids=np.array(recipe_ids, dtype=np.int32),
+            ingredient_counts=np.array(ingredient_counts, dtype=np.int32),
+            line_recipes=np.array(line_recipes, dtype=np.int32),
+            tokens=np.array(tokens, dtype=str),
+            offsets=offsets.astype(np.int64),
+            postings=np.array([line for t in tokens for line in postings[t]], dtype=np.int32),
+        )
+
+    def load(self, path):
+        with np.load(path) as data:
+            index = {k: data[k] for k in data.files}
+        index['vocabulary'] = {token: i for i, token in enumerate(index.pop('tokens').tolist())}
+        return index
+
+    def rank(self, pantry: list) -> 'PantryMatches':
+        # returns the matching recipes which are ordered by coverage as they're paged
+        index = self.get()
+        empty = np.array([], dtype=np.int32)
+        if index is None:
+            return PantryMatches(empty, np.array([]), empty)
+
+        matched_lines = []
+        for item in pantry:
+            tokens = normalize_tokens(item)
+            if not tokens:
+                continue
+            lines = None
+            for token in tokens:
+                position = index['vocabulary'].get(token)
+                if position is None:
+                    lines = empty
+                    break
+                token_lines = index['postings'][index['offsets'][position]:index['offsets'][position + 1]]
+                lines = token_lines if lines is None else np.intersect1d(lines, token_lines, assume_unique=True)
+            matched_lines.append(lines)
+
+        if not matched_lines:
+            return PantryMatches(empty, np.array([]), empty)
+
+        lines = np.unique(np.concatenate(matched_lines))
+        matched = np.bincount(index['line_recipes'][lines], minlength=len(index['recipe_ids']))
+        hits = np.flatnonzero(matched)
+        coverage = matched[hits] / index['ingredient_counts'][hits]
+        missing = index['ingredient_counts'][hits] - matched[hits]
+        return PantryMatches(index['recipe_ids'][hits], coverage, missing)
+
+
+class PantryMatches:
+    """
+    Recipes matching a pantry ordered by coverage descending and then missing count ascending.
+
+    Only the matches up to the requested page are ordered (selected with `np.partition`) so paging through broad
+    pantries, e.g., "salt", doesn't sort every match.
+    """
+
+    def __init__(self, recipe_ids, coverage, missing):
+        self.recipe_ids = recipe_ids
+        self.coverage = coverage
+        self.missing = missing
+
+    def __len__(self):
+        return len(self.recipe_ids)
+
+    def __getitem__(self, index: slice) -> list:
+        # (recipe id, coverage, missing count) tuples
+        top = min(index.stop, len(self))
+        if top <= 0:
+            return []
+        candidates = np.arange(len(self))
+        if top < len(self):
+            # the matches covering at least as much as the last one of the page (ties are ordered by missing count)
+            threshold = -np.partition(-self.coverage, top - 1)[top - 1]
+            candidates = np.flatnonzero(self.coverage >= threshold)
+        order = candidates[np.lexsort((self.missing[candidates], -self.coverage[candidates]))][:top][index]
+        return list(zip(self.recipe_ids[order].tolist(), self.coverage[order].tolist(), self.missing[order].tolist()))
+
+
+class SimilarIndex(FileIndex):
+    """
+    TF-IDF vectors over each recipe's name, categories and ingredients.
+
+    The sparse TF-IDF vectors are reduced with a (seeded) random projection to a dense float32 matrix of
+    L2-normalized rows so similarity is a single matrix-vector product.  The matrix is memory-mapped so the pages are
+    shared by every worker.  Each record holds a recipe id and its vector.
+    """
+    file_name = 'similar.npy'
+    dimensions = 256
+    seed = 0
+
+    @property
+    def dtype(self) -> np.dtype:
+        return np.dtype([('recipe_id', np.int32), ('vector', np.float32, (self.dimensions,))])
+
+    def _recipe_terms(self, name: str, categories: list, ingredients: list) -> list:
+        terms = ['name:{}'.format(t) for t in normalize_tokens(name)]
+        terms += ['category:{}'.format(c) for c in categories if c]
+        for ingredient in recipe_ingredients(ingredients):
+            terms += normalize_tokens(ingredient)
+        return terms
+
+    def write(self, fp):
+        recipes = Recipe.objects.annotate(category_names=ArrayAgg('categories__name')).values_list(
+            'id', 'name', 'category_names', 'ingredients')
+
+        # term counts per recipe and document frequencies
+        recipe_ids = []
+        recipe_terms = []
+        document_frequencies = {}
+        for recipe_id, name, categories, ingredients in recipes.iterator(chunk_size=2000):
+            terms = {}
+            for term in self._recipe_terms(name, categories, ingredients):
+                terms[term] = terms.get(term, 0) + 1
+            for term in terms:
+                document_frequencies[term] = document_frequencies.get(term, 0) + 1
+            recipe_ids.append(recipe_id)
+            recipe_terms.append(terms)
+
+        vocabulary = {term: i for i, term in enumerate(document_frequencies)}
+        idf = np.log((1 + len(recipe_ids)) / (1 + np.array(list(document_frequencies.values()), dtype=np.float32))) + 1
+        projection = np.random.default_rng(self.seed).standard_normal((len(vocabulary), self.dimensions), dtype=np.float32)
+
+        records = np.zeros(len(recipe_ids), dtype=self.dtype)
+        records['recipe_id'] = recipe_ids
+        for row, terms in enumerate(recipe_terms):
+            if not terms:
+                continue
+            columns = np.array([vocabulary[t] for t in terms])
+            weights = np.log1p(np.array(list(terms.values()), dtype=np.float32)) * idf[columns]
+            vector = weights @ projection[columns]
+            records['vector'][row] = vector / (np.linalg.norm(vector) or 1)
+        np.save(fp, records)
+
+    def load(self, path):
+        records = np.load(path, mmap_mode='r')
+        recipe_ids = np.array(records['recipe_id'])
+        return {
+            'rows': {recipe_id: row for row, recipe_id in enumerate(recipe_ids.tolist())},
+            'recipe_ids': recipe_ids,
+            'vectors': records['vector'],
+        }
+
+    def similar(self, recipe_id: int, limit: int):
+        # returns the most similar recipe ids and their cosine similarity or None if the recipe isn't indexed
+        index = self.get()
+        if index is None or recipe_id not in index['rows']:
+            return None
+        row = index['rows'][recipe_id]
+        scores = index['vectors'] @ index['vectors'][row]
+        scores[row] = -np.inf
+        limit = min(limit, len(scores) - 1)
+        if limit <= 0:
+            return np.array([], dtype=np.int32), np.array([], dtype=np.float32)
+        top = np.argpartition(-scores, limit - 1)[:limit]
+        top = top[np.argsort(-scores[top])]
+        return index['recipe_ids'][top], scores[top]
+
+
+def edit_distance(a: str, b: str, max_distance: int) -> int:
+    # damerau-levenshtein (optimal string alignment) distance which gives up beyond the max distance
+    if abs(len(a) - len(b)) > max_distance:
+        return max_distance + 1
+    previous_previous, previous = None, list(range(len(b) + 1))
+    for i in range(1, len(a) + 1):
+        current = [i] + [0] * len(b)
+        for j in range(1, len(b) + 1):
+            cost = 0 if a[i - 1] == b[j - 1] else 1
+            current[j] = min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + cost)
+            if i > 1 and j > 1 and a[i - 1] == b[j - 2] and a[i - 2] == b[j - 1]:
+                current[j] = min(current[j], previous_previous[j - 2] + 1)
+        if min(current) > max_distance:
+            return max_distance + 1
+        previous_previous, previous = previous, current
+    return previous[-1]
+
+
+class SpellingIndex(FileIndex):
+    """
+    Lexicon of the words in the recipes (names and ingredients) and category names with their document frequencies.
+
+    The words are collected with `ts_stat` using the "simple" configuration since the search vector's stemmed lexemes
+    (e.g., "oliv") aren't useful as suggestions.  Each worker loads them into a symmetric delete (SymSpell) index,
+    i.e., every word's deletes within `max_distance` of its prefix, so correcting a word is a handful of dict lookups.
+    """
+    file_name = 'spelling.npz'
+    max_distance = 2
+    prefix_length = 7
+    min_length = 3
+
+    def write(self, fp):
+        with connection.cursor() as cursor:
+            cursor.execute('''
+                SELECT word, ndoc FROM ts_stat($$
+                    SELECT to_tsvector('simple', name || ' ' || array_to_string(ingredients, ' ')) FROM recipes_recipe
+                    UNION ALL
+                    SELECT to_tsvector('simple', name) FROM recipes_category
+                $$)
+            ''')
+            frequencies = {}
+            for word, frequency in cursor.fetchall():
+                word = strip_accents(word)
+                if len(word) >= self.min_length and word.isalpha():
+                    frequencies[word] = frequencies.get(word, 0) + frequency
+        np.savez(
+            fp,
+            words=np.array(list(frequencies), dtype=str),
+            frequencies=np.array(list(frequencies.values()), dtype=np.int32),
+        )
+
+    def _deletes(self, word: str) -> set:
+        # every variation of the word's prefix with up to `max_distance` characters deleted
+        deletes = {word[:self.prefix_length]}
+        edges = set(deletes)
+        for _ in range(self.max_distance):
+            edges = {w[:i] + w[i + 1:] for w in edges for i in range(len(w))} if edges else set()
+            deletes |= edges
+        return deletes
+
+    def load(self, path):
+        with np.load(path) as data:
+            frequencies = dict(zip(data['words'].tolist(), data['frequencies'].tolist()))
+        deletes = {}
+        for word in frequencies:
+            for delete in self._deletes(word):
+                deletes.setdefault(delete, []).append(word)
+        return {'frequencies': frequencies, 'deletes': deletes}
+
+    def correct(self, word: str):
+        # the closest and then most frequent word in the lexicon or None if there isn't one within `max_distance`
+        index = self.get()
+        if index is None or word in index['frequencies']:
+            return None
+        candidates = set()
+        for delete in self._deletes(word):
+            candidates.update(index['deletes'].get(delete, ()))
+        best = None
+        for candidate in candidates:
+            distance = edit_distance(word, candidate, self.max_distance)
+            if distance <= self.max_distance:
+                rank = (distance, -index['frequencies'][candidate])
+                if best is None or rank < best[0]:
+                    best = (rank, candidate)
+        return best[1] if best else None
+
+    def suggest(self, search: str):
+        # the search with its misspelled words corrected (keeping the web search syntax) or None if nothing changed
+        suggestion = RE_WORD.sub(lambda m: self._suggest_word(m.group()), search)
+        return suggestion if suggestion != search else None
+
+    def _suggest_word(self, word: str) -> str:
+        normalized = strip_accents(word).lower()
+        if len(normalized) < self.min_length or normalized == 'or':
+            return word
+        return self.correct(normalized) or word
+
+
+pantry_index = PantryIndex()
+similar_index = SimilarIndex()
+spelling_index = SpellingIndex()
@@ -0,0 +1,23 @@
+from django.db.models import Field, Lookup
+
+
+@Field.register_lookup
+class Any(Lookup):
+    """
+    Matches any value of a list using a single array parameter, i.e., `field = ANY(%s)`.
+
+    Unlike `__in`, the statement is the same no matter how many values are supplied.
+    """
+    lookup_name = 'any'
+
+    def get_prep_lookup(self):
+        return [self.lhs.output_field.get_prep_value(v) for v in self.rhs]
+
+    def get_db_prep_lookup(self, value, connection):
+        # pass the list as a single (array) parameter
+        return '%s', [[self.lhs.output_field.get_db_prep_value(v, connection, prepared=True) for v in value]]
+
+    def as_sql(self, compiler, connection):
+        lhs, lhs_params = self.process_lhs(compiler, connection)
+        rhs, rhs_params = self.process_rhs(compiler, connection)
+        return '{} = ANY({})'.format(lhs, rhs), lhs_params + rhs_params
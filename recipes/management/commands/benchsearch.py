@@ -0,0 +1,60 @@
+import statistics
+import time
+from urllib.parse import urlencode
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.test.utils import override_settings
+from rest_framework.test import APIRequestFactory
+
+from recipes.api.viewsets import RecipeViewSet
+
+# broad, phrase, negated, "or" and narrow searches
+SCENARIOS = [
+    {'search': 'chicken'},
+    {'search': '"olive oil"'},
+    {'search': 'pasta -cheese'},
+    {'search': 'cake or pie'},
+    {'search': 'saffron risotto'},
+]
+
+
+class Command(BaseCommand):
+    """
+    Benchmarks the recipe search api for a set of scenarios, with and without highlighting, to measure its overhead.
+
+    Every request searches again, i.e., neither the responses nor the ordered result ids are served from the cache, so
+    the timings include searching, ranking, paginating and hydrating the page.
+    """
+    help = 'Benchmarks the recipe search api'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--repeat', type=int, default=10, help='Number of requests per scenario')
+
+    def handle(self, *args, **options):
+        # the result ids are cached regardless of the session so caching is disabled altogether
+        with override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.dummy.DummyCache'}}):
+            self.benchmark(options['repeat'])
+
+    def benchmark(self, repeat: int):
+        view = RecipeViewSet.as_view({'get': 'list'})
+        factory = APIRequestFactory()
+
+        self.stdout.write('{:<20} {:>10} {:>14} {:>10}'.format('search', 'plain (ms)', 'highlight (ms)', 'overhead'))
+        for scenario in SCENARIOS:
+            timings = {}
+            for highlight in (False, True):
+                params = dict(scenario, highlight=1) if highlight else scenario
+                request = factory.get('/api/recipe/?{}'.format(urlencode(params)))
+                # requests with a session aren't cached
+                request.COOKIES[settings.SESSION_COOKIE_NAME] = 'benchmark'
+                view(request)  # warm up
+                durations = []
+                for _ in range(repeat):
+                    started = time.perf_counter()
+                    response = view(request)
+                    durations.append(time.perf_counter() - started)
+                    assert response.status_code == 200, response.status_code
+                timings[highlight] = statistics.median(durations) * 1000
+            self.stdout.write('{:<20} {:>10.1f} {:>14.1f} {:>9.0f}%'.format(
+                scenario['search'], timings[False], timings[True], (timings[True] / timings[False] - 1) * 100))
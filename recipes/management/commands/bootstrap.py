@@ -0,0 +1,27 @@
+import time
+
+from django.core.management import call_command
+from django.core.management.base import BaseCommand
+from django.db import connections, DEFAULT_DB_ALIAS
+from django.db.migrations.executor import MigrationExecutor
+
+
+class Command(BaseCommand):
+    help = 'Prepares the database on startup by only migrating when there are unapplied migrations'
+
+    def handle(self, *args, **options):
+        started = time.monotonic()
+
+        # compare the migration files against the applied migrations (a single query)
+        executor = MigrationExecutor(connections[DEFAULT_DB_ALIAS])
+        plan = executor.migration_plan(executor.loader.graph.leaf_nodes())
+        if plan:
+            self.stdout.write(self.style.SUCCESS('Applying {} migrations'.format(len(plan))))
+            call_command('migrate', interactive=False, stdout=self.stdout)
+        else:
+            self.stdout.write(self.style.SUCCESS('Schema is current'))
+
+        # only creates the cache table when it doesn't exist
+        call_command('createcachetable')
+
+        self.stdout.write(self.style.SUCCESS('Bootstrapped in {:.2f}s'.format(time.monotonic() - started)))
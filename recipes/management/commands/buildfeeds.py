@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand
+
+from recipes.feeds import build_feeds
+
+
+class Command(BaseCommand):
+    """
+    Builds the precomputed discovery feeds.
+
+    It runs after every scrape/import (see the "refresh" command) and should also run daily to rotate the random feed.
+    """
+    help = 'Builds the precomputed discovery feeds, e.g., top rated, newest and random picks'
+
+    def handle(self, *args, **options):
+        # cached feed responses are keyed by when their feed was built so the data version isn't bumped
+        feeds = build_feeds()
+        self.stdout.write(self.style.SUCCESS('Built {} feeds'.format(feeds)))
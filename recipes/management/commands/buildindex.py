@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand
+
+from recipes.index import pantry_index, similar_index, spelling_index
+
+
+class Command(BaseCommand):
+    help = 'Builds the precomputed recipe indexes used by the api'
+
+    def handle(self, *args, **options):
+        pantry_index.build()
+        self.stdout.write(self.style.SUCCESS('Built pantry index {}'.format(pantry_index.path)))
+        similar_index.build()
+        self.stdout.write(self.style.SUCCESS('Built similar recipes index {}'.format(similar_index.path)))
+        spelling_index.build()
+        self.stdout.write(self.style.SUCCESS('Built spelling index {}'.format(spelling_index.path)))
@@ -0,0 +1,64 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from recipes.duplicates import duplicate_clusters, recipe_minhash
+from recipes.models import Recipe
+
+CHUNK_SIZE = 1000
+
+
+class Command(BaseCommand):
+    """
+    Finds near-duplicate recipes (e.g., variants and re-publications) using MinHash signatures and LSH.
+
+    Each cluster's most rated recipe is kept as the original and the others are marked as its duplicates so they can
+    be collapsed in the api (i.e., "?collapse_duplicates=1").
+    """
+    help = 'Finds near-duplicate recipes'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--force', action='store_true', help='Computes every signature vs only missing signatures')
+
+    def handle(self, *args, **options):
+        # signatures are computed by the scraper so only imported and edited recipes are missing them
+        recipes = Recipe.objects.only('id', 'ingredients', 'instructions')
+        if not options['force']:
+            recipes = recipes.filter(minhash__isnull=True)
+        computed = 0
+        # only a chunk of (id, signature) instances is held in memory at a time
+        updated = []
+        for recipe in recipes.iterator(chunk_size=CHUNK_SIZE):
+            updated.append(Recipe(id=recipe.id, minhash=recipe_minhash(recipe.ingredients, recipe.instructions)))
+            if len(updated) >= CHUNK_SIZE:
+                Recipe.objects.bulk_update(updated, ['minhash'])
+                computed += len(updated)
+                updated = []
+        if updated:
+            Recipe.objects.bulk_update(updated, ['minhash'])
+            computed += len(updated)
+        self.stdout.write(self.style.SUCCESS('Computed {} signatures'.format(computed)))
+
+        signatures = {
+            recipe_id: bytes(minhash)
+            for recipe_id, minhash in Recipe.objects.filter(minhash__isnull=False).values_list('id', 'minhash').iterator(chunk_size=CHUNK_SIZE)
+        }
+        clusters = duplicate_clusters(signatures)
+
+        # the most rated (and then oldest) recipe of each cluster is the original
+        duplicate_of = {}
+        ratings = dict(Recipe.objects.filter(id__in=[i for c in clusters for i in c]).values_list('id', 'rating_count'))
+        for cluster in clusters:
+            original = min(cluster, key=lambda i: (-(ratings.get(i) or 0), i))
+            duplicate_of.update({i: original for i in cluster if i != original})
+
+        with transaction.atomic():
+            cleared = Recipe.objects.filter(duplicate_of__isnull=False).exclude(id__in=list(duplicate_of)).update(duplicate_of=None)
+            current = dict(Recipe.objects.filter(id__in=list(duplicate_of)).values_list('id', 'duplicate_of'))
+            changed = [
+                Recipe(id=recipe_id, duplicate_of_id=original)
+                for recipe_id, original in duplicate_of.items() if current.get(recipe_id) != original
+            ]
+            Recipe.objects.bulk_update(changed, ['duplicate_of'], batch_size=CHUNK_SIZE)
+
+        self.stdout.write(self.style.SUCCESS('Found {} duplicates in {} clusters ({} changed, {} cleared)'.format(
+            len(duplicate_of), len(clusters), len(changed), cleared)))
@@ -0,0 +1,36 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.utils.dateparse import parse_date
+
+from recipes.export import export_recipes, gzip_stream
+
+
+class Command(BaseCommand):
+    help = 'Exports every recipe as gzipped NDJSON'
+
+    def add_arguments(self, parser):
+        parser.add_argument('output', help='Output file, e.g., "recipes.ndjson.gz"')
+        parser.add_argument('--since', help='Only exports recipes added on or after this date, e.g., "2024-01-31"')
+
+    def handle(self, *args, **options):
+        since = None
+        if options['since']:
+            try:
+                since = parse_date(options['since'])
+            except ValueError:  # well formatted but not a valid date, e.g., "2024-02-30"
+                since = None
+            if not since:
+                raise CommandError('Invalid date for --since')
+
+        exported = 0
+
+        def lines():
+            nonlocal exported
+            for line in export_recipes(since=since):
+                exported += 1
+                yield line
+
+        with open(options['output'], 'wb') as fp:
+            for chunk in gzip_stream(lines()):
+                fp.write(chunk)
+
+        self.stdout.write(self.style.SUCCESS('Exported {} recipes to {}'.format(exported, options['output'])))
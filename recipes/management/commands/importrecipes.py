@@ -0,0 +1,139 @@
+import gzip
+import time
+
+from django.core.management import call_command
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.db.models.expressions import RawSQL
+
+from recipes.models import Recipe, Category
+
+# loads each json line as-is into a jsonb column (the quote and delimiter characters never appear in json)
+SQL_COPY = "COPY import_recipes (doc) FROM STDIN WITH (FORMAT csv, QUOTE E'\\x01', DELIMITER E'\\x02')"
+
+
+def json_array(field: str) -> str:
+    # postgres text array from a json array field of the imported document
+    return "ARRAY(SELECT jsonb_array_elements_text(CASE WHEN jsonb_typeof(doc->'{field}') = 'array' THEN doc->'{field}' ELSE '[]' END))".format(field=field)
+
+
+SQL_UPSERT_CATEGORIES = '''
+INSERT INTO recipes_category (name, type)
+SELECT DISTINCT LOWER(category.name), %s
+FROM import_recipes, jsonb_array_elements_text(CASE WHEN jsonb_typeof(doc->'categories') = 'array' THEN doc->'categories' ELSE '[]' END) AS category(name)
+ON CONFLICT (name) DO NOTHING
+'''
+
+SQL_UPSERT_RECIPES = '''
+INSERT INTO recipes_recipe (
+    slug, name, image_path, description, total_time_string, servings, rating_value, rating_count,
+    ingredients, instructions, author, date_added
+)
+SELECT DISTINCT ON (doc->>'slug')
+    doc->>'slug',
+    doc->>'name',
+    doc->>'image_path',
+    COALESCE(doc->>'description', ''),
+    doc->>'total_time_string',
+    COALESCE(doc->>'servings', ''),
+    (doc->>'rating_value')::integer,
+    (doc->>'rating_count')::integer,
+    {ingredients},
+    {instructions},
+    COALESCE(doc->>'author', ''),
+    COALESCE((doc->>'date_added')::date, CURRENT_DATE)
+FROM import_recipes
+WHERE doc->>'slug' IS NOT NULL
+ORDER BY doc->>'slug'
+ON CONFLICT (slug) DO UPDATE SET
+    name = EXCLUDED.name,
+    image_path = EXCLUDED.image_path,
+    description = EXCLUDED.description,
+    total_time_string = EXCLUDED.total_time_string,
+    servings = EXCLUDED.servings,
+    rating_value = EXCLUDED.rating_value,
+    rating_count = EXCLUDED.rating_count,
+    ingredients = EXCLUDED.ingredients,
+    instructions = EXCLUDED.instructions,
+    author = EXCLUDED.author,
+    -- the signature is recomputed by the "dedupe" command when the content it's computed from changes
+    minhash = CASE
+        WHEN recipes_recipe.ingredients IS DISTINCT FROM EXCLUDED.ingredients
+            OR recipes_recipe.instructions IS DISTINCT FROM EXCLUDED.instructions THEN NULL
+        ELSE recipes_recipe.minhash
+    END
+'''.format(ingredients=json_array('ingredients'), instructions=json_array('instructions'))
+
+# only removes categories which are no longer assigned so unchanged recipes aren't touched (see the change log)
+SQL_DELETE_RECIPE_CATEGORIES = '''
+DELETE FROM recipes_recipe_categories rc
+USING recipes_recipe recipe, import_recipes
+WHERE rc.recipe_id = recipe.id AND recipe.slug = import_recipes.doc->>'slug' AND NOT EXISTS (
+    SELECT 1
+    FROM jsonb_array_elements_text(CASE WHEN jsonb_typeof(doc->'categories') = 'array' THEN doc->'categories' ELSE '[]' END) AS name(name)
+    JOIN recipes_category category ON category.name = LOWER(name.name)
+    WHERE category.id = rc.category_id
+)
+'''
+
+SQL_INSERT_RECIPE_CATEGORIES = '''
+INSERT INTO recipes_recipe_categories (recipe_id, category_id)
+SELECT DISTINCT recipe.id, category.id
+FROM import_recipes
+JOIN recipes_recipe recipe ON recipe.slug = import_recipes.doc->>'slug'
+CROSS JOIN jsonb_array_elements_text(CASE WHEN jsonb_typeof(doc->'categories') = 'array' THEN doc->'categories' ELSE '[]' END) AS name(name)
+JOIN recipes_category category ON category.name = LOWER(name.name)
+ON CONFLICT DO NOTHING
+'''
+
+
+class Command(BaseCommand):
+    """
+    Imports recipes from NDJSON (e.g., from the "export" command) to quickly seed a new instance.
+
+    The documents are loaded with COPY into a staging table and then upserted into the recipes, categories and
+    their relationships using set-based statements.  Search vectors are rebuilt in bulk afterwards.
+    """
+    help = 'Imports recipes from (gzipped) NDJSON'
+
+    def add_arguments(self, parser):
+        parser.add_argument('input', help='Input file, e.g., "recipes.ndjson.gz"')
+        parser.add_argument(
+            '--no-refresh', action='store_true',
+            help='Skips the "refresh" command, e.g., when importing several files (run it once afterwards)')
+
+    def handle(self, *args, **options):
+        started = time.monotonic()
+        open_input = gzip.open if options['input'].endswith('.gz') else open
+
+        with transaction.atomic(), connection.cursor() as cursor:
+            cursor.execute('CREATE TEMPORARY TABLE import_recipes (doc jsonb) ON COMMIT DROP')
+            with open_input(options['input'], 'rb') as fp:
+                cursor.copy_expert(SQL_COPY, fp)
+            cursor.execute('SELECT COUNT(*) FROM import_recipes')
+            documents = cursor.fetchone()[0]
+            self.stdout.write(self.style.SUCCESS('Copied {} documents in {:.1f}s'.format(documents, time.monotonic() - started)))
+
+            upsert_started = time.monotonic()
+            cursor.execute(SQL_UPSERT_CATEGORIES, [Category.TYPE_UNKNOWN])
+            cursor.execute(SQL_UPSERT_RECIPES)
+            recipes = cursor.rowcount
+            cursor.execute(SQL_DELETE_RECIPE_CATEGORIES)
+            cursor.execute(SQL_INSERT_RECIPE_CATEGORIES)
+            self.stdout.write(self.style.SUCCESS('Upserted {} recipes in {:.1f}s'.format(recipes, time.monotonic() - upsert_started)))
+
+            vectors_started = time.monotonic()
+            Recipe.objects.filter(slug__in=RawSQL("SELECT doc->>'slug' FROM import_recipes", [])).update_search_vectors()
+            self.stdout.write(self.style.SUCCESS('Rebuilt search vectors in {:.1f}s'.format(time.monotonic() - vectors_started)))
+
+        # the load (i.e., copy, upsert and search vectors) is reported separately from the refresh
+        seconds = time.monotonic() - started
+        self.stdout.write(self.style.SUCCESS('Loaded {} recipes in {:.1f}s ({:.0f} recipes/s)'.format(
+            recipes, seconds, recipes / seconds if seconds else 0)))
+
+        if options['no_refresh']:
+            self.stdout.write('Skipped refresh (run "python manage.py refresh" afterwards)')
+            return
+        refresh_started = time.monotonic()
+        call_command('refresh', stdout=self.stdout)
+        self.stdout.write(self.style.SUCCESS('Refreshed in {:.1f}s'.format(time.monotonic() - refresh_started)))
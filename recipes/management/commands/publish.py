@@ -0,0 +1,131 @@
+import gzip
+import json
+import os
+from urllib.parse import urljoin
+
+import brotli
+from django.conf import settings
+from django.contrib.postgres.aggregates import ArrayAgg
+from django.core.management.base import BaseCommand
+from django.db.models.expressions import RawSQL
+from django.urls import reverse
+from rest_framework.renderers import JSONRenderer
+from rest_framework.utils.urls import replace_query_param
+
+from recipes.api.filters import RECIPE_ORDERING
+from recipes.api.serializers import CategorySerializer, RecipeSerializer
+from recipes.models import Category, Recipe, RecipeSearch
+
+PUBLISH_DIR = os.path.join(settings.STATIC_ROOT, 'api')
+MANIFEST_FILE = os.path.join(PUBLISH_DIR, 'manifest.json')
+CHUNK_SIZE = 500
+# the snapshots are compressed offline so they use the slowest (and smallest) levels
+GZIP_LEVEL = 9
+BROTLI_QUALITY = 11
+
+
+class Command(BaseCommand):
+    """
+    Publishes static (precompressed) json snapshots of the api which can be served directly by the web server:
+
+        /static/api/recipe/{slug}.json - recipe detail
+        /static/api/category.json - category list
+        /static/api/category/{id}.json - first page of recipes for the category
+
+    Only recipes which have changed since the last publish are rendered again.
+    """
+    help = 'Publishes static json snapshots of the api'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--force', action='store_true', help='Publishes every recipe vs only changed recipes')
+
+    def handle(self, *args, **options):
+        os.makedirs(os.path.join(PUBLISH_DIR, 'recipe'), exist_ok=True)
+        os.makedirs(os.path.join(PUBLISH_DIR, 'category'), exist_ok=True)
+
+        published = self._publish_recipes(force=options['force'])
+        self.stdout.write(self.style.SUCCESS('Published {} recipes'.format(published)))
+
+        categories = self._publish_categories()
+        self.stdout.write(self.style.SUCCESS('Published {} categories'.format(categories)))
+
+    def _publish_recipes(self, force: bool) -> int:
+        # the previous manifest is always loaded so deleted recipes are removed even when forced
+        manifest = {}
+        if os.path.exists(MANIFEST_FILE):
+            with open(MANIFEST_FILE) as fp:
+                manifest = json.load(fp)
+
+        # signature of each recipe's published columns and categories computed by the database (so derived columns
+        # which aren't serialized, e.g., the popularity updated by every "refresh", don't republish every recipe)
+        excluded = [Recipe._meta.get_field(name).column for name in RecipeSerializer.Meta.exclude]
+        signatures = {}
+        recipes = Recipe.objects.annotate(
+            row_hash=RawSQL('md5((to_jsonb({}) - %s::text[])::text)'.format(Recipe._meta.db_table), [excluded]),
+            category_ids=ArrayAgg('categories__id', ordering='categories__id'),
+        ).values_list('id', 'slug', 'row_hash', 'category_ids')
+        for recipe_id, slug, row_hash, category_ids in recipes.iterator(chunk_size=2000):
+            signatures[slug] = (recipe_id, '{}:{}'.format(row_hash, category_ids))
+
+        changed = [
+            recipe_id for slug, (recipe_id, signature) in signatures.items() if force or manifest.get(slug) != signature
+        ]
+        for i in range(0, len(changed), CHUNK_SIZE):
+            for recipe in Recipe.objects.hydrate(changed[i:i + CHUNK_SIZE]):
+                self._write(os.path.join('recipe', '{}.json'.format(recipe.slug)), RecipeSerializer(recipe).data)
+
+        # remove deleted recipes
+        for slug in set(manifest) - set(signatures):
+            for extension in ('', '.gz', '.br'):
+                path = os.path.join(PUBLISH_DIR, 'recipe', '{}.json{}'.format(slug, extension))
+                if os.path.exists(path):
+                    os.remove(path)
+
+        self._write_file(MANIFEST_FILE, json.dumps({slug: signature for slug, (_, signature) in signatures.items()}).encode())
+        return len(changed)
+
+    def _publish_categories(self) -> int:
+        categories = list(Category.objects.all())
+        self._write('category.json', CategorySerializer(categories, many=True).data)
+
+        # remove deleted categories
+        category_files = {'{}.json'.format(category.id) for category in categories}
+        for file_name in os.listdir(os.path.join(PUBLISH_DIR, 'category')):
+            if file_name.split('.json')[0] + '.json' not in category_files:
+                os.remove(os.path.join(PUBLISH_DIR, 'category', file_name))
+
+        # first page of each category using the same ordering and shape as the recipe list api
+        page_size = settings.REST_FRAMEWORK['PAGE_SIZE']
+        list_url = urljoin(settings.PUBLISH_URL, reverse('recipe-list'))
+        for category in categories:
+            queryset = RecipeSearch.objects.filter(category_ids__contains=[category.id]).order_by(*RECIPE_ORDERING)
+            count = queryset.count()
+            recipes = Recipe.objects.hydrate(list(queryset[:page_size].values_list('pk', flat=True)))
+            self._write(os.path.join('category', '{}.json'.format(category.id)), {
+                'count': count,
+                # absolute like the api's pagination links
+                'next': replace_query_param(
+                    '{}?categories={}'.format(list_url, category.id), 'page', 2) if count > page_size else None,
+                'previous': None,
+                'results': RecipeSerializer(recipes, many=True).data,
+            })
+        return len(categories)
+
+    def _write(self, name: str, data):
+        content = JSONRenderer().render(data)
+        path = os.path.join(PUBLISH_DIR, name)
+        # skip unchanged content so file timestamps (and client caches) stay valid
+        if os.path.exists(path):
+            with open(path, 'rb') as fp:
+                if fp.read() == content:
+                    return
+        self._write_file('{}.gz'.format(path), gzip.compress(content, compresslevel=GZIP_LEVEL))
+        self._write_file('{}.br'.format(path), brotli.compress(content, quality=BROTLI_QUALITY))
+        self._write_file(path, content)
+
+    def _write_file(self, path: str, content: bytes):
+        # write to a temporary file and swap it in so the web server never serves a partial file
+        path_tmp = '{}.tmp'.format(path)
+        with open(path_tmp, 'wb') as fp:
+            fp.write(content)
+        os.replace(path_tmp, path)
@@ -0,0 +1,23 @@
+from django.core.cache import cache
+from django.core.management import call_command
+from django.core.management.base import BaseCommand
+
+from recipes.models import Recipe, RecipeChange, RecipeSearch, DataVersion
+
+
+class Command(BaseCommand):
+    help = 'Refreshes everything derived from the recipes after they change, e.g., after scraping or importing'
+
+    def handle(self, *args, **options):
+        Recipe.objects.all().update_popularity()
+        self.stdout.write(self.style.SUCCESS('Updated popularity'))
+        call_command('dedupe', stdout=self.stdout)
+        self.stdout.write(self.style.SUCCESS('Compacted change log ({} removed)'.format(RecipeChange.compact())))
+        RecipeSearch.refresh()
+        self.stdout.write(self.style.SUCCESS('Refreshed search table'))
+        call_command('buildindex', stdout=self.stdout)
+        call_command('buildfeeds', stdout=self.stdout)
+        call_command('publish', stdout=self.stdout)
+        DataVersion.bump()
+        cache.clear()
+        self.stdout.write(self.style.SUCCESS('Bumped data version and cleared cache'))
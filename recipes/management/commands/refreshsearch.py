@@ -0,0 +1,23 @@
+from django.core.management.base import BaseCommand
+
+from recipes.models import DataVersion, RecipeSearch
+
+
+class Command(BaseCommand):
+    """
+    Refreshes the search table and bumps the data version when the admin has changed recipes or categories.
+
+    It's scheduled every minute so a burst of admin changes is only refreshed once.
+    """
+    help = 'Refreshes the search table when a refresh has been requested, e.g., by the admin'
+
+    def handle(self, *args, **options):
+        requested = DataVersion.current().refresh_requested
+        if requested is None:
+            self.stdout.write('No refresh requested')
+            return
+        RecipeSearch.refresh()
+        DataVersion.bump()
+        # changes made during the refresh are left for the next run
+        DataVersion.objects.filter(pk=1, refresh_requested=requested).update(refresh_requested=None)
+        self.stdout.write(self.style.SUCCESS('Refreshed search table and bumped data version'))
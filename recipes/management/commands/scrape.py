@@ -8,24 +8,25 @@ import logging
 from typing import Union, Tuple
 from urllib.parse import urlparse
 import requests
-from django.contrib.postgres.aggregates import StringAgg
 from lxml import etree
 from django.conf import settings
-from django.contrib.postgres.search import SearchVector
+from django.core.management import call_command
 from django.core.management.base import BaseCommand, CommandError
 from django.core.cache import cache
 from recipe_scrapers import scrape_html
 
-from recipe_api.settings import POSTGRES_LANGUAGE_UNACCENT
+from recipe_api.settings import CACHE_DIR
+from recipes.duplicates import recipe_minhash
 from recipes.models import Recipe, Category
+from recipes.stats import RunStats
 
-CACHE_DIR = '/tmp/recipes'
 URL_NYT = 'https://cooking.nytimes.com'
 
 
 class Command(BaseCommand):
     help = 'Scrape NYT recipes'
     force = False
+    stats = None  # type: RunStats
 
     def add_arguments(self, parser):
         parser.add_argument('--urls', action='store_true', help='Scrapes all recipe urls')
@@ -43,23 +44,31 @@ class Command(BaseCommand):
 
         self._validate_cache_path()
 
-        if options['urls']:
-            self._scrape_urls()
-        if options['recipes']:
-            self.scrape_recipes()
-        if options['specific_recipe_slug']:
-            self.scrape_specific_recipe(options['specific_recipe_slug'])
-
-        # clear cache
-        cache.clear()
+        # stage timings and counters which are saved as a report even if the scrape fails
+        self.stats = RunStats('scrape')
+        try:
+            if options['urls']:
+                self._scrape_urls()
+            if options['recipes']:
+                self.scrape_recipes()
+            if options['specific_recipe_slug']:
+                self.scrape_specific_recipe(options['specific_recipe_slug'])
+
+            # refresh everything derived from the recipes
+            if options['recipes'] or options['specific_recipe_slug']:
+                with self.stats.stage('refresh'):
+                    call_command('refresh', stdout=self.stdout)
+            else:
+                cache.clear()
+        finally:
+            self.stdout.write(self.stats.summary())
+            self.stdout.write(self.style.SUCCESS('Saved scrape report {}'.format(self.stats.save())))
 
     def scrape_specific_recipe(self, slug: str):
         recipe, image_url = self._scrape_recipe_url('{base_url}/recipes/{slug}'.format(base_url=URL_NYT, slug=slug.strip()))
         # save search vector
-        vector = self._get_search_vector()
-        for recipe in Recipe.objects.filter(slug=slug).annotate(vector=vector):
-            recipe.search_vector = recipe.vector
-            recipe.save()
+        with self.stats.stage('vectors'):
+            Recipe.objects.filter(slug=slug).update_search_vectors()
         self._scrape_recipe_image(recipe, image_url)
         self.stdout.write(self.style.SUCCESS('Completed scraping {}'.format(recipe)))
 
@@ -67,33 +76,23 @@ class Command(BaseCommand):
 
         self._scrape_recipes()
 
-        # define search vector
-        vector = self._get_search_vector()
-
         self.stdout.write(self.style.SUCCESS('Creating search vectors'))
 
-        # add search vector to all recipes
-        # NOTE: it's necessary to do it one by one since django doesn't support updates on aggregates (e.g., categories)
-        for recipe in Recipe.objects.annotate(vector=vector):
-            recipe.search_vector = recipe.vector
-            recipe.save()
+        # add search vector to all recipes in a single statement
+        with self.stats.stage('vectors'):
+            Recipe.objects.all().update_search_vectors()
 
         self.stdout.write(self.style.SUCCESS('Complete'))
 
-    def _get_search_vector(self):
-        return (
-                SearchVector('name', weight='A', config=POSTGRES_LANGUAGE_UNACCENT) +
-                SearchVector(StringAgg('categories__name', ' '), weight='B', config=POSTGRES_LANGUAGE_UNACCENT) +
-                SearchVector('ingredients', weight='C', config=POSTGRES_LANGUAGE_UNACCENT)
-        )
-
-    def _fetch_url_content(self, url) -> str:
+    def _fetch_url_content(self, url) -> bytes:
         response = requests.get(url, timeout=30)
-        return response.content.decode()
+        return response.content
 
     def _fetch_page_props(self, url: str) -> dict:
-        content = self._fetch_url_content(url)
-        return self._parse_page_props(content)
+        with self.stats.stage('discover') as stage:
+            content = self._fetch_url_content(url)
+            stage.bytes += len(content)
+            return self._parse_page_props(content)
 
     def _parse_page_props(self, content) -> dict:
         empty = {}
@@ -121,9 +120,11 @@ class Command(BaseCommand):
                 # repeat requests a few times for failures
                 self.stdout.write(self.style.WARNING('Bad sequential response #{} for {}'.format(sequential_failures, url)))
                 sequential_failures += 1
+                self.stats.increment('discover_retries')
                 # too many consecutive errors for this page - go to the next page
                 if sequential_failures > 5:
                     self.stdout.write(self.style.WARNING('Too many failures for {}, continuing'.format(url)))
+                    self.stats.increment('discover_pages_skipped')
                     page += 1
                 continue
 
@@ -166,6 +167,7 @@ class Command(BaseCommand):
 
         # save output as json file
         json.dump({'urls': list(recipe_urls)}, open(os.path.join(CACHE_DIR, 'urls.json'), 'w'), indent=2)
+        self.stats.increment('urls', len(recipe_urls))
         self.stdout.write(self.style.SUCCESS('Completed {} urls'.format(len(recipe_urls))))
 
     def _scrape_recipes(self):
@@ -189,6 +191,7 @@ class Command(BaseCommand):
 
             # skip if we already have this recipe imported
             if not self.force and self._recipe_exists(slug=slug):
+                self.stats.increment('recipes_skipped')
                 continue
 
             # scrape recipe
@@ -197,6 +200,7 @@ class Command(BaseCommand):
             except Exception as e:
                 logging.exception(e)
                 logging.warning('ERROR scraping url {}'.format(url))
+                self.stats.increment('recipes_failed')
                 continue
 
             # scrape image
@@ -205,11 +209,15 @@ class Command(BaseCommand):
             except Exception as e:
                 logging.exception(e)
                 self.stdout.write(self.style.ERROR('Could not download image {} for {}'.format(image_url, recipe)))
+                self.stats.increment('images_failed')
 
             if i != 0 and i % 100 == 0:
-                self.stdout.write(self.style.SUCCESS('Scraped {} recipes so far'.format(i)))
+                fetch = self.stats.stages.get('fetch')
+                self.stdout.write(self.style.SUCCESS('Scraped {} recipes so far ({:.2f} pages/s)'.format(
+                    i, fetch.count / fetch.seconds if fetch and fetch.seconds else 0)))
 
             recipes_scraped += 1
+            self.stats.increment('recipes_scraped')
 
         self.stdout.write(self.style.SUCCESS('Scraped {} recipes total'.format(recipes_scraped)))
 
@@ -225,43 +233,50 @@ class Command(BaseCommand):
         # return Recipe and external image url
 
         # fetch url
-        response = requests.get(url, timeout=20)
+        with self.stats.stage('fetch') as stage:
+            response = requests.get(url, timeout=20)
+            stage.bytes += len(response.content)
+        if not response.ok:
+            self.stats.increment('fetch_status_{}'.format(response.status_code))
         # parse recipe
-        scraper = scrape_html(response.content, org_url=url, wild_mode=True)
-        recipe_data = scraper.to_json()
-        # validate it has ingredients
-        if not recipe_data.get('ingredients'):
-            raise Exception(f'skipping recipe {url} without ingredients or instructions')
-        # handle ingredient groups by flattening them with special characters defining the group name
-        if len(recipe_data.get('ingredient_groups', [])) > 1:
-            # convert ingredient groups into a custom/flat list
-            recipe_data['ingredients'] = self._convert_ingredient_groups(recipe_data)
-        # save the recipe
-        recipe, _ = Recipe.objects.update_or_create(
-            slug=os.path.basename(url),
-            defaults=dict(
-                name=recipe_data.get('title'),
-                description=self._replace_recipe_links_to_internal(recipe_data.get('description')),
-                total_time_string=f"{recipe_data.get('total_time')} min",
-                servings=recipe_data.get('yields') or '',
-                rating_value=recipe_data.get('ratings'),
-                rating_count=recipe_data.get('ratings_count'),
-                ingredients=self._replace_recipe_links_to_internal(recipe_data.get('ingredients')),
-                instructions=self._replace_recipe_links_to_internal(recipe_data.get('instructions_list')),
-                author=recipe_data.get('author'),
-            ),
-        )
-        # set categories/keywords
-        categories = []
-        for keyword in scraper.keywords():
-            category, _ = Category.objects.update_or_create(
-                name=keyword.lower(),
+        with self.stats.stage('parse'):
+            scraper = scrape_html(response.content, org_url=url, wild_mode=True)
+            recipe_data = scraper.to_json()
+            # validate it has ingredients
+            if not recipe_data.get('ingredients'):
+                raise Exception(f'skipping recipe {url} without ingredients or instructions')
+            # handle ingredient groups by flattening them with special characters defining the group name
+            if len(recipe_data.get('ingredient_groups', [])) > 1:
+                # convert ingredient groups into a custom/flat list
+                recipe_data['ingredients'] = self._convert_ingredient_groups(recipe_data)
+        with self.stats.stage('write'):
+            # save the recipe
+            recipe, _ = Recipe.objects.update_or_create(
+                slug=os.path.basename(url),
                 defaults=dict(
-                    type=Category.TYPE_UNKNOWN,
+                    name=recipe_data.get('title'),
+                    description=self._replace_recipe_links_to_internal(recipe_data.get('description')),
+                    total_time_string=f"{recipe_data.get('total_time')} min",
+                    servings=recipe_data.get('yields') or '',
+                    rating_value=recipe_data.get('ratings'),
+                    rating_count=recipe_data.get('ratings_count'),
+                    ingredients=self._replace_recipe_links_to_internal(recipe_data.get('ingredients')),
+                    instructions=self._replace_recipe_links_to_internal(recipe_data.get('instructions_list')),
+                    author=recipe_data.get('author'),
+                    minhash=recipe_minhash(recipe_data.get('ingredients'), recipe_data.get('instructions_list')),
                 ),
             )
-            categories.append(category)
-        recipe.categories.set(categories)
+            # set categories/keywords
+            categories = []
+            for keyword in scraper.keywords():
+                category, _ = Category.objects.update_or_create(
+                    name=keyword.lower(),
+                    defaults=dict(
+                        type=Category.TYPE_UNKNOWN,
+                    ),
+                )
+                categories.append(category)
+            recipe.categories.set(categories)
 
         return recipe, scraper.image()
 
@@ -280,18 +295,23 @@ class Command(BaseCommand):
 
         # download images we haven't already scraped
         if not os.path.exists(image_path_file):
+            with self.stats.stage('image') as stage:
 
-            # fetch image
-            response = requests.get(image_url, stream=True, timeout=20)
-            response.raise_for_status()
+                # fetch image
+                response = requests.get(image_url, stream=True, timeout=20)
+                response.raise_for_status()
 
-            # write to the static "output" directory
-            with open(image_path_file, 'wb') as out_file:
-                shutil.copyfileobj(response.raw, out_file)
+                # write to the static "output" directory
+                with open(image_path_file, 'wb') as out_file:
+                    shutil.copyfileobj(response.raw, out_file)
+                stage.bytes += os.path.getsize(image_path_file)
+        else:
+            self.stats.increment('images_existing')
 
         # save the recipe with the new image path
-        recipe.image_path = f'{settings.STATIC_URL}recipes/{image_name}'
-        recipe.save()
+        with self.stats.stage('write'):
+            recipe.image_path = f'{settings.STATIC_URL}recipes/{image_name}'
+            recipe.save()
 
     def _replace_recipe_links_to_internal(self, value: Union[str, list]) -> Union[str, list]:
         domain_parsed = urlparse(URL_NYT)
@@ -0,0 +1,72 @@
+# Generated by Django 3.2.20 on 2026-10-19 10:41
+
+import django.contrib.postgres.fields
+import django.contrib.postgres.search
+from django.db import migrations, models
+import django.db.models.deletion
+
+# narrow, denormalized search relation which serves the search and list api
+SQL_CREATE_RECIPE_SEARCH = '''
+CREATE MATERIALIZED VIEW recipes_recipesearch AS
+SELECT
+    recipe.id AS recipe_id,
+    recipe.search_vector,
+    COALESCE(ARRAY_AGG(rc.category_id ORDER BY rc.category_id) FILTER (WHERE rc.category_id IS NOT NULL), '{}') AS category_ids,
+    recipe.rating_value,
+    recipe.rating_count,
+    recipe.date_added,
+    recipe.name,
+    recipe.slug,
+    recipe.image_path,
+    recipe.description,
+    recipe.total_time_string,
+    recipe.servings
+FROM recipes_recipe recipe
+LEFT JOIN recipes_recipe_categories rc ON rc.recipe_id = recipe.id
+GROUP BY recipe.id;
+'''
+
+# indexes for the query shapes the RecipeViewSet issues (the unique index is required to refresh concurrently)
+SQL_CREATE_RECIPE_SEARCH_INDEXES = '''
+CREATE UNIQUE INDEX recipes_recipesearch_recipe_id ON recipes_recipesearch (recipe_id);
+CREATE UNIQUE INDEX recipes_recipesearch_slug ON recipes_recipesearch (slug);
+CREATE INDEX recipes_recipesearch_name ON recipes_recipesearch (name);
+CREATE INDEX recipes_recipesearch_search_vector ON recipes_recipesearch USING GIN (search_vector);
+CREATE INDEX recipes_recipesearch_category_ids ON recipes_recipesearch USING GIN (category_ids);
+CREATE INDEX recipes_recipesearch_rating ON recipes_recipesearch (rating_value DESC NULLS LAST, rating_count DESC);
+CREATE INDEX recipes_recipesearch_rating_count ON recipes_recipesearch (rating_count);
+CREATE INDEX recipes_recipesearch_date_added ON recipes_recipesearch (date_added);
+'''
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0023_alter_category_type'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RecipeSearch',
+            fields=[
+                ('recipe', models.OneToOneField(on_delete=django.db.models.deletion.DO_NOTHING, primary_key=True, related_name='+', serialize=False, to='recipes.recipe')),
+                ('search_vector', django.contrib.postgres.search.SearchVectorField(null=True)),
+                ('category_ids', django.contrib.postgres.fields.ArrayField(base_field=models.IntegerField(), size=None)),
+                ('rating_value', models.IntegerField(null=True)),
+                ('rating_count', models.IntegerField(null=True)),
+                ('date_added', models.DateField()),
+                ('name', models.CharField(max_length=500)),
+                ('slug', models.SlugField(max_length=200)),
+                ('image_path', models.CharField(max_length=210, null=True)),
+                ('description', models.TextField()),
+                ('total_time_string', models.CharField(max_length=100, null=True)),
+                ('servings', models.CharField(max_length=100)),
+            ],
+            options={
+                'db_table': 'recipes_recipesearch',
+                'managed': False,
+            },
+        ),
+        migrations.RunSQL(SQL_CREATE_RECIPE_SEARCH, 'DROP MATERIALIZED VIEW recipes_recipesearch'),
+        migrations.RunSQL(SQL_CREATE_RECIPE_SEARCH_INDEXES, migrations.RunSQL.noop),
+    ]
@@ -0,0 +1,29 @@
+# Generated by Django 3.2.20 on 2026-10-19 10:43
+
+from django.db import migrations, models
+from django.db.migrations import RunPython
+import django.utils.timezone
+
+
+def create_data_version(apps, schema):
+    DataVersion = apps.get_model("recipes", "DataVersion")
+    DataVersion.objects.get_or_create(pk=1)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0024_recipesearch'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DataVersion',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('version', models.PositiveIntegerField(default=0)),
+                ('updated', models.DateTimeField(default=django.utils.timezone.now)),
+            ],
+        ),
+        RunPython(create_data_version, RunPython.noop),
+    ]
@@ -0,0 +1,127 @@
+# Generated by Django 3.2.20 on 2026-10-19 10:57
+
+from django.db import migrations, models
+import django.utils.timezone
+
+# stamps "updated_at" when a recipe's content changes (derived columns like the search vector are ignored)
+SQL_CREATE_TOUCH_TRIGGER = '''
+-- for inserts which don't go through the orm, e.g., the "importrecipes" command
+ALTER TABLE recipes_recipe ALTER COLUMN updated_at SET DEFAULT now();
+
+CREATE FUNCTION recipes_recipe_touch() RETURNS trigger AS $$
+BEGIN
+    IF to_jsonb(NEW) - 'search_vector' - 'updated_at' IS DISTINCT FROM to_jsonb(OLD) - 'search_vector' - 'updated_at' THEN
+        NEW.updated_at := now();
+    ELSE
+        -- ignore stale values written back by the orm
+        NEW.updated_at := GREATEST(OLD.updated_at, NEW.updated_at);
+    END IF;
+    RETURN NEW;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER recipes_recipe_touch BEFORE UPDATE ON recipes_recipe
+FOR EACH ROW EXECUTE PROCEDURE recipes_recipe_touch();
+
+-- category changes touch their recipes
+CREATE FUNCTION recipes_recipe_categories_touch() RETURNS trigger AS $$
+BEGIN
+    IF TG_OP = 'INSERT' THEN
+        UPDATE recipes_recipe SET updated_at = now() WHERE id IN (SELECT recipe_id FROM new_rows);
+    ELSE
+        UPDATE recipes_recipe SET updated_at = now() WHERE id IN (SELECT recipe_id FROM old_rows);
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER recipes_recipe_categories_touch_insert AFTER INSERT ON recipes_recipe_categories
+REFERENCING NEW TABLE AS new_rows FOR EACH STATEMENT EXECUTE PROCEDURE recipes_recipe_categories_touch();
+CREATE TRIGGER recipes_recipe_categories_touch_delete AFTER DELETE ON recipes_recipe_categories
+REFERENCING OLD TABLE AS old_rows FOR EACH STATEMENT EXECUTE PROCEDURE recipes_recipe_categories_touch();
+'''
+
+SQL_DROP_TOUCH_TRIGGER = '''
+DROP TRIGGER recipes_recipe_categories_touch_insert ON recipes_recipe_categories;
+DROP TRIGGER recipes_recipe_categories_touch_delete ON recipes_recipe_categories;
+DROP FUNCTION recipes_recipe_categories_touch();
+DROP TRIGGER recipes_recipe_touch ON recipes_recipe;
+DROP FUNCTION recipes_recipe_touch();
+ALTER TABLE recipes_recipe ALTER COLUMN updated_at DROP DEFAULT;
+'''
+
+# logs inserted, touched and deleted recipes (set-based so bulk statements log in a single insert)
+SQL_CREATE_LOG_TRIGGER = '''
+CREATE FUNCTION recipes_recipe_log() RETURNS trigger AS $$
+BEGIN
+    IF TG_OP = 'INSERT' THEN
+        INSERT INTO recipes_recipechange (transaction_id, recipe_id, slug, deleted, changed_at)
+        SELECT txid_current(), id, slug, false, updated_at FROM new_rows ORDER BY id;
+    ELSIF TG_OP = 'UPDATE' THEN
+        INSERT INTO recipes_recipechange (transaction_id, recipe_id, slug, deleted, changed_at)
+        SELECT txid_current(), new_rows.id, new_rows.slug, false, new_rows.updated_at
+        FROM new_rows JOIN old_rows ON old_rows.id = new_rows.id
+        WHERE new_rows.updated_at IS DISTINCT FROM old_rows.updated_at
+        ORDER BY new_rows.id;
+    ELSE
+        INSERT INTO recipes_recipechange (transaction_id, recipe_id, slug, deleted, changed_at)
+        SELECT txid_current(), id, slug, true, now() FROM old_rows ORDER BY id;
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER recipes_recipe_log_insert AFTER INSERT ON recipes_recipe
+REFERENCING NEW TABLE AS new_rows FOR EACH STATEMENT EXECUTE PROCEDURE recipes_recipe_log();
+CREATE TRIGGER recipes_recipe_log_update AFTER UPDATE ON recipes_recipe
+REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows FOR EACH STATEMENT EXECUTE PROCEDURE recipes_recipe_log();
+CREATE TRIGGER recipes_recipe_log_delete AFTER DELETE ON recipes_recipe
+REFERENCING OLD TABLE AS old_rows FOR EACH STATEMENT EXECUTE PROCEDURE recipes_recipe_log();
+
+-- existing recipes are the initial changes
+INSERT INTO recipes_recipechange (transaction_id, recipe_id, slug, deleted, changed_at)
+SELECT txid_current(), id, slug, false, updated_at FROM recipes_recipe ORDER BY id;
+'''
+
+SQL_DROP_LOG_TRIGGER = '''
+DROP TRIGGER recipes_recipe_log_insert ON recipes_recipe;
+DROP TRIGGER recipes_recipe_log_update ON recipes_recipe;
+DROP TRIGGER recipes_recipe_log_delete ON recipes_recipe;
+DROP FUNCTION recipes_recipe_log();
+'''
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0026_feed'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RecipeChange',
+            fields=[
+                ('id', models.BigAutoField(primary_key=True, serialize=False)),
+                ('transaction_id', models.BigIntegerField()),
+                ('recipe_id', models.IntegerField()),
+                ('slug', models.CharField(max_length=200)),
+                ('deleted', models.BooleanField(default=False)),
+                ('changed_at', models.DateTimeField(default=django.utils.timezone.now)),
+            ],
+        ),
+        migrations.AddField(
+            model_name='recipe',
+            name='updated_at',
+            field=models.DateTimeField(default=django.utils.timezone.now, editable=False),
+        ),
+        migrations.AddIndex(
+            model_name='recipe',
+            index=models.Index(fields=['updated_at'], name='recipes_rec_updated_46db5b_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='recipechange',
+            index=models.Index(fields=['transaction_id', 'id'], name='recipes_rec_transac_69fc36_idx'),
+        ),
+        migrations.RunSQL(SQL_CREATE_TOUCH_TRIGGER, SQL_DROP_TOUCH_TRIGGER),
+        migrations.RunSQL(SQL_CREATE_LOG_TRIGGER, SQL_DROP_LOG_TRIGGER),
+    ]
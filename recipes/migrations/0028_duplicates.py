@@ -0,0 +1,88 @@
+# Generated by Django 3.2.20 on 2026-10-19 10:59
+
+from importlib import import_module
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+recipe_search = import_module('recipes.migrations.0024_recipesearch')
+
+# the search table with the duplicate column so duplicates can be collapsed
+SQL_CREATE_RECIPE_SEARCH = '''
+CREATE MATERIALIZED VIEW recipes_recipesearch AS
+SELECT
+    recipe.id AS recipe_id,
+    recipe.search_vector,
+    COALESCE(ARRAY_AGG(rc.category_id ORDER BY rc.category_id) FILTER (WHERE rc.category_id IS NOT NULL), '{}') AS category_ids,
+    recipe.rating_value,
+    recipe.rating_count,
+    recipe.date_added,
+    recipe.duplicate_of_id,
+    recipe.name,
+    recipe.slug,
+    recipe.image_path,
+    recipe.description,
+    recipe.total_time_string,
+    recipe.servings
+FROM recipes_recipe recipe
+LEFT JOIN recipes_recipe_categories rc ON rc.recipe_id = recipe.id
+GROUP BY recipe.id;
+'''
+
+SQL_CREATE_RECIPE_SEARCH_INDEXES = '''
+CREATE UNIQUE INDEX recipes_recipesearch_recipe_id ON recipes_recipesearch (recipe_id);
+CREATE UNIQUE INDEX recipes_recipesearch_slug ON recipes_recipesearch (slug);
+CREATE INDEX recipes_recipesearch_name ON recipes_recipesearch (name);
+CREATE INDEX recipes_recipesearch_search_vector ON recipes_recipesearch USING GIN (search_vector);
+CREATE INDEX recipes_recipesearch_category_ids ON recipes_recipesearch USING GIN (category_ids);
+CREATE INDEX recipes_recipesearch_rating ON recipes_recipesearch (rating_value DESC NULLS LAST, rating_count DESC);
+CREATE INDEX recipes_recipesearch_rating_distinct ON recipes_recipesearch (rating_value DESC NULLS LAST, rating_count DESC)
+WHERE duplicate_of_id IS NULL;
+CREATE INDEX recipes_recipesearch_rating_count ON recipes_recipesearch (rating_count);
+CREATE INDEX recipes_recipesearch_date_added ON recipes_recipesearch (date_added);
+'''
+
+SQL_DROP_RECIPE_SEARCH = 'DROP MATERIALIZED VIEW recipes_recipesearch;'
+
+# the derived minhash and duplicate columns aren't content changes (see migrations/0027_recipechange.py)
+SQL_TOUCH_FUNCTION = '''
+CREATE OR REPLACE FUNCTION recipes_recipe_touch() RETURNS trigger AS $$
+BEGIN
+    IF to_jsonb(NEW) - {ignored} IS DISTINCT FROM to_jsonb(OLD) - {ignored} THEN
+        NEW.updated_at := now();
+    ELSE
+        -- ignore stale values written back by the orm
+        NEW.updated_at := GREATEST(OLD.updated_at, NEW.updated_at);
+    END IF;
+    RETURN NEW;
+END;
+$$ LANGUAGE plpgsql;
+'''
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0027_recipechange'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='recipe',
+            name='duplicate_of',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='duplicates', to='recipes.recipe'),
+        ),
+        migrations.AddField(
+            model_name='recipe',
+            name='minhash',
+            field=models.BinaryField(editable=False, null=True),
+        ),
+        migrations.RunSQL(
+            SQL_DROP_RECIPE_SEARCH + SQL_CREATE_RECIPE_SEARCH + SQL_CREATE_RECIPE_SEARCH_INDEXES,
+            SQL_DROP_RECIPE_SEARCH + recipe_search.SQL_CREATE_RECIPE_SEARCH + recipe_search.SQL_CREATE_RECIPE_SEARCH_INDEXES,
+        ),
+        migrations.RunSQL(
+            SQL_TOUCH_FUNCTION.format(ignored="'{search_vector,updated_at,minhash,duplicate_of_id}'::text[]"),
+            SQL_TOUCH_FUNCTION.format(ignored="'{search_vector,updated_at}'::text[]"),
+        ),
+    ]
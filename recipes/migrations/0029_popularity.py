@@ -0,0 +1,102 @@
+# Generated by Django 3.2.20 on 2026-10-19 11:00
+
+from importlib import import_module
+
+from django.db import migrations, models
+
+duplicates = import_module('recipes.migrations.0028_duplicates')
+
+# the search table with popularity and indexes which match the default ordering, i.e., (popularity, id) descending
+SQL_CREATE_RECIPE_SEARCH = '''
+CREATE MATERIALIZED VIEW recipes_recipesearch AS
+SELECT
+    recipe.id AS recipe_id,
+    recipe.search_vector,
+    COALESCE(ARRAY_AGG(rc.category_id ORDER BY rc.category_id) FILTER (WHERE rc.category_id IS NOT NULL), '{}') AS category_ids,
+    recipe.rating_value,
+    recipe.rating_count,
+    recipe.popularity,
+    recipe.date_added,
+    recipe.duplicate_of_id,
+    recipe.name,
+    recipe.slug,
+    recipe.image_path,
+    recipe.description,
+    recipe.total_time_string,
+    recipe.servings
+FROM recipes_recipe recipe
+LEFT JOIN recipes_recipe_categories rc ON rc.recipe_id = recipe.id
+GROUP BY recipe.id;
+'''
+
+SQL_CREATE_RECIPE_SEARCH_INDEXES = '''
+CREATE UNIQUE INDEX recipes_recipesearch_recipe_id ON recipes_recipesearch (recipe_id);
+CREATE UNIQUE INDEX recipes_recipesearch_slug ON recipes_recipesearch (slug);
+CREATE INDEX recipes_recipesearch_name ON recipes_recipesearch (name);
+CREATE INDEX recipes_recipesearch_search_vector ON recipes_recipesearch USING GIN (search_vector);
+CREATE INDEX recipes_recipesearch_category_ids ON recipes_recipesearch USING GIN (category_ids);
+CREATE INDEX recipes_recipesearch_popularity ON recipes_recipesearch (popularity DESC, recipe_id DESC);
+CREATE INDEX recipes_recipesearch_popularity_distinct ON recipes_recipesearch (popularity DESC, recipe_id DESC)
+WHERE duplicate_of_id IS NULL;
+CREATE INDEX recipes_recipesearch_rating_value ON recipes_recipesearch (rating_value);
+CREATE INDEX recipes_recipesearch_rating_count ON recipes_recipesearch (rating_count);
+CREATE INDEX recipes_recipesearch_date_added ON recipes_recipesearch (date_added);
+'''
+
+SQL_DROP_RECIPE_SEARCH = 'DROP MATERIALIZED VIEW recipes_recipesearch;'
+
+# initial popularity (see recipes.models.SQL_UPDATE_POPULARITY)
+SQL_UPDATE_POPULARITY = '''
+WITH prior AS (
+    SELECT
+        COALESCE(AVG(rating_value), 0) AS mean,
+        COALESCE(PERCENTILE_CONT(0.5) WITHIN GROUP (ORDER BY rating_count), 0) AS weight
+    FROM recipes_recipe
+    WHERE rating_value IS NOT NULL AND rating_count > 0
+), popularity AS (
+    SELECT
+        recipe.id,
+        CASE WHEN recipe.rating_value IS NOT NULL AND recipe.rating_count > 0
+            THEN (prior.weight * prior.mean + recipe.rating_value * recipe.rating_count) / (prior.weight + recipe.rating_count)
+            ELSE prior.mean
+        END AS popularity
+    FROM recipes_recipe recipe, prior
+)
+UPDATE recipes_recipe recipe SET popularity = popularity.popularity
+FROM popularity
+WHERE recipe.id = popularity.id AND recipe.popularity IS DISTINCT FROM popularity.popularity
+'''
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0028_duplicates'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='recipe',
+            name='popularity',
+            field=models.FloatField(default=0, editable=False),
+        ),
+        migrations.AddIndex(
+            model_name='recipe',
+            index=models.Index(fields=['-popularity', '-id'], name='recipes_recipe_popularity'),
+        ),
+        # for inserts which don't go through the orm, e.g., the "importrecipes" command
+        migrations.RunSQL(
+            'ALTER TABLE recipes_recipe ALTER COLUMN popularity SET DEFAULT 0',
+            'ALTER TABLE recipes_recipe ALTER COLUMN popularity DROP DEFAULT',
+        ),
+        # popularity is derived so it's not a content change (see migrations/0027_recipechange.py)
+        migrations.RunSQL(
+            duplicates.SQL_TOUCH_FUNCTION.format(ignored="'{search_vector,updated_at,minhash,duplicate_of_id,popularity}'::text[]"),
+            duplicates.SQL_TOUCH_FUNCTION.format(ignored="'{search_vector,updated_at,minhash,duplicate_of_id}'::text[]"),
+        ),
+        migrations.RunSQL(SQL_UPDATE_POPULARITY, migrations.RunSQL.noop),
+        migrations.RunSQL(
+            SQL_DROP_RECIPE_SEARCH + SQL_CREATE_RECIPE_SEARCH + SQL_CREATE_RECIPE_SEARCH_INDEXES,
+            SQL_DROP_RECIPE_SEARCH + duplicates.SQL_CREATE_RECIPE_SEARCH + duplicates.SQL_CREATE_RECIPE_SEARCH_INDEXES,
+        ),
+    ]
@@ -0,0 +1,57 @@
+# Generated by Django 3.2.20 on 2026-10-19 11:30
+
+from importlib import import_module
+
+from django.db import migrations
+
+popularity = import_module('recipes.migrations.0029_popularity')
+
+# the list api hydrates the full recipes so the search table drops the card columns and only keeps name and slug for
+# their exact filters
+SQL_CREATE_RECIPE_SEARCH = '''
+CREATE MATERIALIZED VIEW recipes_recipesearch AS
+SELECT
+    recipe.id AS recipe_id,
+    recipe.search_vector,
+    COALESCE(ARRAY_AGG(rc.category_id ORDER BY rc.category_id) FILTER (WHERE rc.category_id IS NOT NULL), '{}') AS category_ids,
+    recipe.rating_value,
+    recipe.rating_count,
+    recipe.popularity,
+    recipe.date_added,
+    recipe.duplicate_of_id,
+    recipe.name,
+    recipe.slug
+FROM recipes_recipe recipe
+LEFT JOIN recipes_recipe_categories rc ON rc.recipe_id = recipe.id
+GROUP BY recipe.id;
+'''
+
+SQL_CREATE_RECIPE_SEARCH_INDEXES = '''
+CREATE UNIQUE INDEX recipes_recipesearch_recipe_id ON recipes_recipesearch (recipe_id);
+CREATE UNIQUE INDEX recipes_recipesearch_slug ON recipes_recipesearch (slug);
+CREATE INDEX recipes_recipesearch_name ON recipes_recipesearch (name);
+CREATE INDEX recipes_recipesearch_search_vector ON recipes_recipesearch USING GIN (search_vector);
+CREATE INDEX recipes_recipesearch_category_ids ON recipes_recipesearch USING GIN (category_ids);
+CREATE INDEX recipes_recipesearch_popularity ON recipes_recipesearch (popularity DESC, recipe_id DESC);
+CREATE INDEX recipes_recipesearch_popularity_distinct ON recipes_recipesearch (popularity DESC, recipe_id DESC)
+WHERE duplicate_of_id IS NULL;
+CREATE INDEX recipes_recipesearch_rating_value ON recipes_recipesearch (rating_value);
+CREATE INDEX recipes_recipesearch_rating_count ON recipes_recipesearch (rating_count);
+CREATE INDEX recipes_recipesearch_date_added ON recipes_recipesearch (date_added);
+'''
+
+SQL_DROP_RECIPE_SEARCH = 'DROP MATERIALIZED VIEW recipes_recipesearch;'
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0029_popularity'),
+    ]
+
+    operations = [
+        migrations.RunSQL(
+            SQL_DROP_RECIPE_SEARCH + SQL_CREATE_RECIPE_SEARCH + SQL_CREATE_RECIPE_SEARCH_INDEXES,
+            SQL_DROP_RECIPE_SEARCH + popularity.SQL_CREATE_RECIPE_SEARCH + popularity.SQL_CREATE_RECIPE_SEARCH_INDEXES,
+        ),
+    ]
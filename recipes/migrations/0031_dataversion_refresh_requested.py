@@ -0,0 +1,18 @@
+# Generated by Django 3.2.20 on 2026-10-19 11:25
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0030_recipesearch_narrow'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='dataversion',
+            name='refresh_requested',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+    ]
@@ -0,0 +1,52 @@
+# Generated by Django 3.2.20 on 2026-10-19 11:40
+
+from django.db import migrations
+
+# the content columns, i.e., every column except the derived ones (search_vector, popularity, minhash and
+# duplicate_of_id) which are updated in bulk, e.g., by the "refresh" command
+CONTENT_COLUMNS = (
+    'name, slug, image_path, description, total_time_string, servings, rating_value, rating_count, ingredients, '
+    'instructions, author, date_added'
+)
+
+# the triggers only fire when content (or updated_at) is assigned so bulk updates of derived columns skip them, and
+# changes are logged per row so updates don't collect transition tables of every updated row
+SQL_CREATE_TRIGGERS = '''
+DROP TRIGGER recipes_recipe_touch ON recipes_recipe;
+CREATE TRIGGER recipes_recipe_touch BEFORE UPDATE OF {columns} ON recipes_recipe
+FOR EACH ROW EXECUTE PROCEDURE recipes_recipe_touch();
+
+CREATE FUNCTION recipes_recipe_log_update() RETURNS trigger AS $$
+BEGIN
+    INSERT INTO recipes_recipechange (transaction_id, recipe_id, slug, deleted, changed_at)
+    VALUES (txid_current(), NEW.id, NEW.slug, false, NEW.updated_at);
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER recipes_recipe_log_update ON recipes_recipe;
+CREATE TRIGGER recipes_recipe_log_update AFTER UPDATE OF {columns}, updated_at ON recipes_recipe
+FOR EACH ROW WHEN (OLD.updated_at IS DISTINCT FROM NEW.updated_at) EXECUTE PROCEDURE recipes_recipe_log_update();
+'''.format(columns=CONTENT_COLUMNS)
+
+SQL_DROP_TRIGGERS = '''
+DROP TRIGGER recipes_recipe_log_update ON recipes_recipe;
+DROP FUNCTION recipes_recipe_log_update();
+CREATE TRIGGER recipes_recipe_log_update AFTER UPDATE ON recipes_recipe
+REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows FOR EACH STATEMENT EXECUTE PROCEDURE recipes_recipe_log();
+
+DROP TRIGGER recipes_recipe_touch ON recipes_recipe;
+CREATE TRIGGER recipes_recipe_touch BEFORE UPDATE ON recipes_recipe
+FOR EACH ROW EXECUTE PROCEDURE recipes_recipe_touch();
+'''
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0031_dataversion_refresh_requested'),
+    ]
+
+    operations = [
+        migrations.RunSQL(SQL_CREATE_TRIGGERS, SQL_DROP_TRIGGERS),
+    ]
@@ -1,8 +1,87 @@
+from datetime import timedelta
+
+from django.conf import settings
 from django.contrib.postgres import fields
 from django.contrib.postgres.indexes import GinIndex
 from django.contrib.postgres.search import SearchVectorField
-from django.db import models
-from django.db.models import Index
+from django.db import connection, models
+from django.db.models import F, Index
+from django.utils import timezone
+
+
+# rebuilds the weighted search vector of the name, category names and ingredients for a subquery of recipe ids
+SQL_UPDATE_SEARCH_VECTORS = '''
+UPDATE recipes_recipe recipe SET search_vector = (
+    setweight(to_tsvector(%s::regconfig, COALESCE(recipe.name, '')), 'A') ||
+    setweight(to_tsvector(%s::regconfig, COALESCE((
+        SELECT STRING_AGG(category.name, ' ')
+        FROM recipes_recipe_categories rc
+        JOIN recipes_category category ON category.id = rc.category_id
+        WHERE rc.recipe_id = recipe.id
+    ), '')), 'B') ||
+    setweight(to_tsvector(%s::regconfig, COALESCE(recipe.ingredients::text, '')), 'C')
+)
+WHERE recipe.id IN ({ids})
+'''
+
+# bayesian average of the rating, i.e., the rating is pulled towards the mean rating of every recipe in proportion to
+# how few ratings it has (relative to the median rating count) so a single 5 star rating doesn't top the popular recipes
+SQL_UPDATE_POPULARITY = '''
+WITH prior AS (
+    SELECT
+        COALESCE(AVG(rating_value), 0) AS mean,
+        COALESCE(PERCENTILE_CONT(0.5) WITHIN GROUP (ORDER BY rating_count), 0) AS weight
+    FROM recipes_recipe
+    WHERE rating_value IS NOT NULL AND rating_count > 0
+), popularity AS (
+    SELECT
+        recipe.id,
+        CASE WHEN recipe.rating_value IS NOT NULL AND recipe.rating_count > 0
+            THEN (prior.weight * prior.mean + recipe.rating_value * recipe.rating_count) / (prior.weight + recipe.rating_count)
+            ELSE prior.mean
+        END AS popularity
+    FROM recipes_recipe recipe, prior
+    WHERE recipe.id IN ({ids})
+)
+UPDATE recipes_recipe recipe SET popularity = popularity.popularity
+FROM popularity
+WHERE recipe.id = popularity.id AND recipe.popularity IS DISTINCT FROM popularity.popularity
+'''
+
+# removes changes which are superseded by a later change of the same recipe (the change feed only returns the latest)
+SQL_COMPACT_RECIPE_CHANGES = '''
+DELETE FROM recipes_recipechange
+WHERE id IN (
+    SELECT id FROM (
+        SELECT id, ROW_NUMBER() OVER (PARTITION BY recipe_id ORDER BY transaction_id DESC, id DESC) AS position
+        FROM recipes_recipechange
+    ) changes
+    WHERE position > 1
+)
+'''
+
+
+class RecipeQuerySet(models.QuerySet):
+
+    def hydrate(self, ids: list) -> list:
+        # fetch recipes (and their categories) for the supplied ids and return them in the same order
+        recipes = self.prefetch_related('categories').in_bulk(ids)
+        return [recipes[i] for i in ids if i in recipes]
+
+    def update_popularity(self):
+        # recompute the popularity of the recipes in this queryset in a single statement
+        ids_sql, ids_params = self.values('pk').query.sql_with_params()
+        with connection.cursor() as cursor:
+            cursor.execute(SQL_UPDATE_POPULARITY.format(ids=ids_sql), ids_params)
+
+    def update_search_vectors(self):
+        # rebuild the search vectors for the recipes in this queryset in a single statement
+        ids_sql, ids_params = self.values('pk').query.sql_with_params()
+        with connection.cursor() as cursor:
+            cursor.execute(
+                SQL_UPDATE_SEARCH_VECTORS.format(ids=ids_sql),
+                [settings.POSTGRES_LANGUAGE_UNACCENT] * 3 + list(ids_params),
+            )
 
 
 class Recipe(models.Model):
@@ -14,12 +93,21 @@ class Recipe(models.Model):
     servings = models.CharField(max_length=100)
     rating_value = models.IntegerField(null=True, blank=True)
     rating_count = models.IntegerField(null=True, blank=True)
+    # default ordering (see `RecipeQuerySet.update_popularity()`)
+    popularity = models.FloatField(default=0, editable=False)
     ingredients = fields.ArrayField(base_field=models.CharField(max_length=1500))
     instructions = fields.ArrayField(base_field=models.CharField(max_length=3000))
     categories = models.ManyToManyField('Category')
     author = models.CharField(max_length=100)
     search_vector = SearchVectorField(null=True)  # postgres search vector populated after creation
     date_added = models.DateField(auto_now_add=True)
+    # maintained by a database trigger whenever the content or categories change (see migrations/0027_recipechange.py)
+    updated_at = models.DateTimeField(default=timezone.now, editable=False)
+    # near-duplicate detection (see recipes/duplicates.py and the "dedupe" command)
+    minhash = models.BinaryField(null=True, editable=False)
+    duplicate_of = models.ForeignKey('self', null=True, blank=True, on_delete=models.SET_NULL, related_name='duplicates')
+
+    objects = RecipeQuerySet.as_manager()
 
     class Meta:
         indexes = [
@@ -27,12 +115,48 @@ class Recipe(models.Model):
             Index(fields=['slug']),
             Index(fields=['rating_value']),
             Index(fields=['rating_count']),
+            Index(fields=['updated_at']),
+            Index(fields=['-popularity', '-id'], name='recipes_recipe_popularity'),
         ]
 
     def __str__(self):
         return self.name
 
 
+class RecipeChange(models.Model):
+    """
+    Log of recipe changes and deletions (tombstones) which serves the incremental change feed.
+
+    Rows are only written by database triggers (see migrations/0027_recipechange.py) so every write path, including
+    the scraper, bulk imports and the admin, is captured.  They're read in (transaction id, id) order since changes
+    become visible in transaction order rather than id order.
+    """
+    id = models.BigAutoField(primary_key=True)
+    transaction_id = models.BigIntegerField()
+    # not a foreign key so tombstones outlive their recipes
+    recipe_id = models.IntegerField()
+    slug = models.CharField(max_length=200)
+    deleted = models.BooleanField(default=False)
+    changed_at = models.DateTimeField(default=timezone.now)
+
+    # deleted recipes are reported to clients which sync at least this often
+    tombstone_retention = timedelta(days=90)
+
+    class Meta:
+        indexes = [
+            Index(fields=['transaction_id', 'id']),
+        ]
+
+    @classmethod
+    def compact(cls) -> int:
+        # removes superseded changes and expired tombstones and returns how many were removed
+        with connection.cursor() as cursor:
+            cursor.execute(SQL_COMPACT_RECIPE_CHANGES)
+            compacted = cursor.rowcount
+        expired, _ = cls.objects.filter(deleted=True, changed_at__lt=timezone.now() - cls.tombstone_retention).delete()
+        return compacted + expired
+
+
 class Category(models.Model):
 
     TYPE_SPECIAL_DIET = 'special_diets'
@@ -51,3 +175,73 @@ class Category(models.Model):
 
     def __str__(self):
         return self.name
+
+
+class RecipeSearch(models.Model):
+    """
+    Narrow, denormalized copy of the recipes which serves the search and list api.
+
+    It's a postgres materialized view (see migrations/0024_recipesearch.py) so it must be refreshed after recipes change.
+    """
+    recipe = models.OneToOneField(Recipe, primary_key=True, on_delete=models.DO_NOTHING, related_name='+')
+    search_vector = SearchVectorField(null=True)
+    category_ids = fields.ArrayField(base_field=models.IntegerField())
+    rating_value = models.IntegerField(null=True)
+    rating_count = models.IntegerField(null=True)
+    popularity = models.FloatField()
+    date_added = models.DateField()
+    duplicate_of = models.ForeignKey(Recipe, null=True, on_delete=models.DO_NOTHING, related_name='+')
+    # exact filters (the list api hydrates the full recipes)
+    name = models.CharField(max_length=500)
+    slug = models.SlugField(max_length=200)
+
+    class Meta:
+        managed = False
+        db_table = 'recipes_recipesearch'
+
+    @classmethod
+    def refresh(cls):
+        # concurrently so searches aren't blocked during the refresh
+        with connection.cursor() as cursor:
+            cursor.execute('REFRESH MATERIALIZED VIEW CONCURRENTLY {}'.format(cls._meta.db_table))
+
+
+class DataVersion(models.Model):
+    """
+    Global version of the recipe data which is bumped by the scrape and admin whenever recipes or categories change.
+
+    It's a single row (created in migrations/0025_dataversion.py) so reading it is a cheap primary key lookup.
+    """
+    version = models.PositiveIntegerField(default=0)
+    updated = models.DateTimeField(default=timezone.now)
+    # when the admin changed recipes or categories which haven't been refreshed yet (see the "refreshsearch" command)
+    refresh_requested = models.DateTimeField(null=True, blank=True)
+
+    @classmethod
+    def current(cls) -> 'DataVersion':
+        # NOTE: get_or_create() always reads from the primary
+        return cls.objects.filter(pk=1).first() or cls.objects.get_or_create(pk=1)[0]
+
+    @classmethod
+    def bump(cls):
+        if not cls.objects.filter(pk=1).update(version=F('version') + 1, updated=timezone.now()):
+            cls.objects.create(pk=1, version=1)
+
+    @classmethod
+    def request_refresh(cls):
+        if not cls.objects.filter(pk=1).update(refresh_requested=timezone.now()):
+            cls.objects.create(pk=1, refresh_requested=timezone.now())
+
+
+class Feed(models.Model):
+    """
+    Precomputed, ordered list of recipe ids for a named discovery feed, e.g., "top-rated" (see recipes/feeds.py).
+
+    Feeds are rebuilt after recipes change so serving a page is a primary key lookup and hydrating the page's recipes.
+    """
+    name = models.SlugField(max_length=100, unique=True)
+    recipe_ids = fields.ArrayField(base_field=models.IntegerField())
+    updated = models.DateTimeField(default=timezone.now)
+
+    def __str__(self):
+        return self.name
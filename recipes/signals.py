@@ -0,0 +1,51 @@
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models.signals import m2m_changed, post_delete, post_save, pre_delete, pre_save
+from django.dispatch import receiver
+
+from recipes.models import Category, Recipe
+
+
+def recipe_cache_key(value, field: str = 'slug') -> str:
+    # serialized recipe cached by its slug or id until that recipe changes (see the signals below)
+    return 'recipe:{}:{}'.format(field, value)
+
+
+def invalidate_recipes(recipes):
+    # (id, slug) pairs which are invalidated after the commit so concurrent requests can't cache the old recipe again
+    keys = [key for recipe_id, slug in recipes for key in (recipe_cache_key(slug), recipe_cache_key(recipe_id, 'id'))]
+    transaction.on_commit(lambda: cache.delete_many(keys))
+
+
+@receiver(pre_save, sender=Recipe)
+def recipe_pre_save(sender, instance, raw=False, **kwargs):
+    # remember the stored slug so a renamed recipe's old entry is invalidated as well
+    if instance.pk and not raw:
+        instance._stored_slug = Recipe.objects.filter(pk=instance.pk).values_list('slug', flat=True).first()
+
+
+@receiver(post_save, sender=Recipe)
+@receiver(post_delete, sender=Recipe)
+def recipe_changed(sender, instance, **kwargs):
+    invalidate_recipes({
+        (instance.pk, instance.slug),
+        (instance.pk, getattr(instance, '_stored_slug', None) or instance.slug),
+    })
+
+
+@receiver(m2m_changed, sender=Recipe.categories.through)
+def recipe_categories_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    if not reverse:
+        if action.startswith('post_'):
+            invalidate_recipes([(instance.pk, instance.slug)])
+    elif action == 'pre_clear':
+        # the category's recipes aren't known once it's been cleared
+        invalidate_recipes(instance.recipe_set.values_list('id', 'slug'))
+    elif action in ('post_add', 'post_remove'):
+        invalidate_recipes(Recipe.objects.filter(pk__in=pk_set).values_list('id', 'slug'))
+
+
+@receiver(pre_delete, sender=Category)
+def category_deleted(sender, instance, **kwargs):
+    # the category's relationships are deleted without any m2m signals
+    invalidate_recipes(instance.recipe_set.values_list('id', 'slug'))
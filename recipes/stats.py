@@ -0,0 +1,91 @@
+import json
+import os
+import time
+from contextlib import contextmanager
+
+from django.utils import timezone
+
+from recipe_api.settings import CACHE_DIR
+
+REPORTS_DIR = os.path.join(CACHE_DIR, 'reports')
+
+
+class Stage:
+    def __init__(self):
+        self.seconds = 0.0
+        self.count = 0
+        self.bytes = 0
+        self.failures = {}
+
+    def report(self) -> dict:
+        return {
+            'seconds': round(self.seconds, 3),
+            'count': self.count,
+            'per_second': round(self.count / self.seconds, 2) if self.seconds else None,
+            'bytes': self.bytes,
+            'failures': self.failures,
+        }
+
+
+class RunStats:
+    """
+    Per-stage timings and counters of a long running command, e.g., scraping, which are saved as a json report.
+
+    Each stage tracks its total seconds, successful count (and rate), bytes transferred and failures by exception type:
+
+        with stats.stage('fetch') as stage:
+            response = requests.get(url)
+            stage.bytes += len(response.content)
+
+    Reports are saved to `REPORTS_DIR` as "{name}-{timestamp}.json" so throughput can be tracked over time.
+    """
+
+    def __init__(self, name: str):
+        self.name = name
+        self.started = timezone.now()
+        self.started_monotonic = time.monotonic()
+        self.stages = {}
+        self.counters = {}
+
+    @contextmanager
+    def stage(self, name: str):
+        stage = self.stages.setdefault(name, Stage())
+        started = time.monotonic()
+        try:
+            yield stage
+        except Exception as e:
+            failure = type(e).__name__
+            stage.failures[failure] = stage.failures.get(failure, 0) + 1
+            raise
+        else:
+            stage.count += 1
+        finally:
+            stage.seconds += time.monotonic() - started
+
+    def increment(self, counter: str, value: int = 1):
+        self.counters[counter] = self.counters.get(counter, 0) + value
+
+    def report(self) -> dict:
+        return {
+            'name': self.name,
+            'started': self.started.isoformat(),
+            'seconds': round(time.monotonic() - self.started_monotonic, 3),
+            'stages': {name: stage.report() for name, stage in self.stages.items()},
+            'counters': self.counters,
+        }
+
+    def summary(self) -> str:
+        # human readable table of the stages, slowest first
+        lines = ['{:<12} {:>10} {:>8} {:>10} {:>12} {:>9}'.format('stage', 'seconds', 'count', 'per second', 'bytes', 'failures')]
+        for name, stage in sorted(self.stages.items(), key=lambda item: -item[1].seconds):
+            lines.append('{:<12} {:>10.1f} {:>8} {:>10.2f} {:>12} {:>9}'.format(
+                name, stage.seconds, stage.count, stage.count / stage.seconds if stage.seconds else 0, stage.bytes,
+                sum(stage.failures.values())))
+        return '\n'.join(lines)
+
+    def save(self) -> str:
+        os.makedirs(REPORTS_DIR, exist_ok=True)
+        path = os.path.join(REPORTS_DIR, '{}-{}.json'.format(self.name, self.started.strftime('%Y%m%d-%H%M%S')))
+        with open(path, 'w') as fp:
+            json.dump(self.report(), fp, indent=2)
+        return path
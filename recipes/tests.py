@@ -1,3 +1,318 @@
-from django.test import TestCase
+from array import array
+from datetime import timedelta
+from unittest import mock
 
-# Create your tests here.
+import numpy as np
+from django.contrib.postgres.search import SearchVector
+from django.core.cache import cache
+from django.db import connection
+from django.test import SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from rest_framework.pagination import PageNumberPagination
+from rest_framework.request import Request
+from rest_framework.test import APIRequestFactory
+
+from recipe_api.settings import POSTGRES_LANGUAGE_UNACCENT
+from recipes.api import views
+from recipes.api.caching import ResultIds, query_signature
+from recipes.api.filters import SearchVectorFilter
+from recipes.api.viewsets import RecipeViewSet
+from recipes.index import PantryMatches
+from recipes.models import Category, DataVersion, Recipe, RecipeChange, RecipeSearch
+
+
+def filter_recipes(query_string: str):
+    # the recipe list queryset after all the viewset's filter backends have been applied
+    request = Request(APIRequestFactory().get('/api/recipe/{}'.format(query_string)))
+    view = RecipeViewSet(action='list', request=request, format_kwarg=None, kwargs={})
+    return view.filter_queryset(view.get_queryset())
+
+
+def create_recipe(name: str, **kwargs) -> Recipe:
+    return Recipe.objects.create(**{
+        'name': name,
+        'slug': name.lower().replace(' ', '-'),
+        'description': '',
+        'servings': '4',
+        'ingredients': [],
+        'instructions': [],
+        'author': '',
+        **kwargs,
+    })
+
+
+class SearchQueryCompileTestCase(SimpleTestCase):
+
+    def test_single_tsquery(self):
+        sql = str(filter_recipes('?search="olive oil" or butter -garlic').query)
+        self.assertIn('websearch_to_tsquery', sql)
+        # the search isn't also applied term by term
+        self.assertNotIn('plainto_tsquery', sql)
+
+    def test_without_search(self):
+        sql = str(filter_recipes('?search=').query)
+        self.assertNotIn('tsquery', sql)
+
+
+class PantryMatchesTestCase(SimpleTestCase):
+
+    def test_pages(self):
+        matched, counts = np.array([1, 2, 1, 3, 2, 1]), np.array([2, 2, 1, 4, 4, 2])
+        matches = PantryMatches(np.array([10, 11, 12, 13, 14, 15]), matched / counts, counts - matched)
+        ordered = [11, 12, 13, 10, 15, 14]
+        # pages match sorting every match
+        self.assertEqual([m[0] for m in matches[0:2]], ordered[0:2])
+        self.assertEqual([m[0] for m in matches[2:4]], ordered[2:4])
+        self.assertEqual([m[0] for m in matches[4:6]], ordered[4:6])
+        self.assertEqual(matches[6:8], [])
+        self.assertEqual(matches[3:4], [(10, 0.5, 1)])
+
+
+class SearchVectorFilterTestCase(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.dinner = Category.objects.create(name='dinner', type=Category.TYPE_UNKNOWN)
+        cls.dessert = Category.objects.create(name='dessert', type=Category.TYPE_UNKNOWN)
+        recipes = [
+            ('Garlic Butter Chicken', ['chicken', 'butter', 'garlic'], cls.dinner, 5),
+            ('Olive Oil Cake', ['olive oil', 'flour', 'sugar'], cls.dessert, 4),
+            ('Chicken With Olive Oil', ['chicken', 'olive oil', 'lemon'], cls.dinner, 3),
+            ('Oil and Olive Salad', ['oil', 'olive', 'lettuce'], cls.dinner, None),
+        ]
+        for name, ingredients, category, rating_value in recipes:
+            recipe = create_recipe(name, rating_value=rating_value, ingredients=ingredients)
+            recipe.categories.set([category])
+        Recipe.objects.update(search_vector=(
+            SearchVector('name', weight='A', config=POSTGRES_LANGUAGE_UNACCENT) +
+            SearchVector('ingredients', weight='C', config=POSTGRES_LANGUAGE_UNACCENT)
+        ))
+        RecipeSearch.refresh()
+
+    def search(self, query_string: str) -> list:
+        return list(filter_recipes(query_string).values_list('slug', flat=True))
+
+    def test_phrase(self):
+        self.assertCountEqual(self.search('?search="olive oil"'), ['olive-oil-cake', 'chicken-with-olive-oil'])
+
+    def test_or(self):
+        self.assertCountEqual(self.search('?search=cake or salad'), ['olive-oil-cake', 'oil-and-olive-salad'])
+
+    def test_negation(self):
+        self.assertEqual(self.search('?search=chicken -garlic'), ['chicken-with-olive-oil'])
+
+    def test_single_statement(self):
+        queryset = filter_recipes('?search=chicken or cake')
+        with self.assertNumQueries(1):
+            self.assertEqual(len(list(queryset)), 3)
+
+    def test_chained_filters(self):
+        self.assertEqual(self.search('?search=olive&categories={}'.format(self.dessert.id)), ['olive-oil-cake'])
+        self.assertEqual(
+            self.search('?search=chicken&categories={}&ordering=rating_value'.format(self.dinner.id)),
+            ['chicken-with-olive-oil', 'garlic-butter-chicken'],
+        )
+
+    def test_bounded_by_explicit_ordering(self):
+        # the candidates are the first matches by the requested ordering rather than the default ordering
+        with mock.patch.object(SearchVectorFilter, 'candidate_limit', 1):
+            self.assertEqual(self.search('?search=chicken&ordering=rating_value'), ['chicken-with-olive-oil'])
+            self.assertEqual(self.search('?search=chicken&ordering=-rating_value'), ['garlic-butter-chicken'])
+
+
+@override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}})
+class ConditionalRequestTestCase(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        create_recipe('Soup')
+        RecipeSearch.refresh()
+        DataVersion.bump()
+
+    def setUp(self):
+        cache.clear()
+
+    def get(self, **headers):
+        request = APIRequestFactory().get('/api/recipe/', **headers)
+        return RecipeViewSet.as_view({'get': 'list'})(request)
+
+    def test_not_modified(self):
+        etag = self.get()['ETag']
+        # only the data version is read, i.e., the results aren't queried or serialized
+        with mock.patch.object(RecipeViewSet, 'list') as list_view, self.assertNumQueries(1):
+            response = self.get(HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        list_view.assert_not_called()
+
+    def test_data_version_bump(self):
+        etag = self.get()['ETag']
+        DataVersion.bump()
+        response = self.get(HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+
+
+class ResultIdsTestCase(SimpleTestCase):
+
+    def signature(self, query_string: str) -> str:
+        request = Request(APIRequestFactory().get('/api/recipe/{}'.format(query_string)))
+        return query_signature(request, exclude=('page', 'highlight'))
+
+    def test_signature(self):
+        signature = self.signature('?search=chicken&categories=1&categories=2&ordering=rating_value')
+        # pages and highlighting share the same results
+        self.assertEqual(signature, self.signature(
+            '?search=chicken&categories=1&categories=2&ordering=rating_value&page=2&highlight=1'))
+        # the order of the params (and of repeated values) doesn't change the results
+        self.assertEqual(signature, self.signature('?ordering=rating_value&categories=2&search=chicken&categories=1'))
+        # but every other param does, including the order of the ordering fields
+        for query_string in (
+                '?search=chicken&categories=1&ordering=rating_value',
+                '?search=chicken&categories=1&categories=2&ordering=-rating_value',
+                '?search=chicken&categories=1&categories=2&ordering=rating_value,date_added',
+                '?search=beef&categories=1&categories=2&ordering=rating_value',
+                '?search=chicken&categories=1&categories=2&ordering=rating_value&collapse_duplicates=1',
+        ):
+            self.assertNotEqual(signature, self.signature(query_string), query_string)
+        self.assertNotEqual(
+            self.signature('?ordering=rating_value,date_added'), self.signature('?ordering=date_added,rating_value'))
+
+    def test_pages(self):
+        results = ResultIds({
+            'ids': array('i', [5, 3, 9, 1, 7]).tobytes(),
+            'ranks': array('f', [0.5, 0.4, 0.3, 0.2, 0.1]).tobytes(),
+            'count': 5,
+        }, get_queryset=None)
+        paginator = PageNumberPagination()
+        paginator.page_size = 2
+        pages = [
+            paginator.paginate_queryset(results, Request(APIRequestFactory().get('/api/recipe/?page={}'.format(page))))
+            for page in (1, 2, 3)
+        ]
+        self.assertEqual([[recipe_id for recipe_id, _ in page] for page in pages], [[5, 3], [9, 1], [7]])
+        self.assertAlmostEqual(pages[1][0][1], 0.3)
+        self.assertEqual(paginator.page.paginator.count, 5)
+
+
+@override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}})
+class ResultIdsCacheTestCase(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.recipes = [
+            create_recipe(name, rating_value=rating_value)
+            for name, rating_value in (('Soup', 5), ('Salad', 3), ('Cake', None))
+        ]
+        RecipeSearch.refresh()
+
+    def setUp(self):
+        cache.clear()
+
+    def results(self, query_string: str) -> ResultIds:
+        request = Request(APIRequestFactory().get('/api/recipe/{}'.format(query_string)))
+        view = RecipeViewSet(action='list', request=request, format_kwarg=None, kwargs={})
+        return view.get_results(request)
+
+    def test_cached_per_data_version(self):
+        soup, salad, cake = self.recipes
+        with mock.patch.object(ResultIds, 'build', wraps=ResultIds.build) as build:
+            results = self.results('?ordering=rating_value')
+            self.assertEqual(list(results.ids), [salad.id, soup.id, cake.id])
+            # other pages of the same results are sliced from the cached ids
+            self.assertEqual(list(self.results('?ordering=rating_value&page=2&highlight=1').ids), list(results.ids))
+            self.assertEqual(build.call_count, 1)
+            # a different query is built separately
+            self.results('?ordering=-rating_value')
+            self.assertEqual(build.call_count, 2)
+
+            # bumping the data version invalidates the cached ids
+            DataVersion.bump()
+            self.results('?ordering=rating_value')
+            self.assertEqual(build.call_count, 3)
+
+
+class RecipeChangesTestCase(TransactionTestCase):
+    # not wrapped in a transaction since changes are only returned once their transaction has committed
+
+    def changes(self, since: str = None) -> dict:
+        query_string = '?since={}'.format(since) if since else ''
+        request = APIRequestFactory().get('/api/recipe/changes/{}'.format(query_string))
+        return views.RecipeChangesView.as_view()(request).data
+
+    def logged(self, recipe: Recipe) -> list:
+        return list(RecipeChange.objects.filter(recipe_id=recipe.id).order_by('id').values_list('slug', 'deleted'))
+
+    def test_log(self):
+        recipe = create_recipe('Soup')
+        category = Category.objects.create(name='dinner', type=Category.TYPE_UNKNOWN)
+        self.assertEqual(self.logged(recipe), [('soup', False)])
+
+        # saving without any content changes isn't logged
+        recipe.save()
+        # nor are the derived columns
+        Recipe.objects.filter(pk=recipe.pk).update_search_vectors()
+        Recipe.objects.filter(pk=recipe.pk).update(popularity=4.5, minhash=b'signature')
+        self.assertEqual(len(self.logged(recipe)), 1)
+
+        recipe.slug = 'tomato-soup'
+        recipe.save()
+        self.assertEqual(self.logged(recipe)[-1], ('tomato-soup', False))
+
+        # category changes touch their recipes
+        recipe.categories.add(category)
+        recipe.categories.remove(category)
+        self.assertEqual(len(self.logged(recipe)), 4)
+
+        recipe_id = recipe.id
+        recipe.delete()
+        self.assertEqual(RecipeChange.objects.filter(recipe_id=recipe_id).last().deleted, True)
+
+    def test_paging(self):
+        soup, salad = create_recipe('Soup'), create_recipe('Salad')
+        soup.name = 'Tomato Soup'
+        soup.save()
+        cake = create_recipe('Cake')
+        cake_id = cake.id
+        cake.delete()
+
+        with mock.patch.object(views, 'CHANGES_LIMIT', 3):
+            page = self.changes()
+            self.assertTrue(page['has_more'])
+            # only the latest change of each recipe in a page
+            self.assertEqual(
+                [(r['slug'], r['name']) for r in page['changed']], [('salad', 'Salad'), ('soup', 'Tomato Soup')])
+            self.assertEqual(page['deleted'], [])
+
+            page = self.changes(page['cursor'])
+            self.assertFalse(page['has_more'])
+            self.assertEqual(page['changed'], [])
+            self.assertEqual(page['deleted'], [{'id': cake_id, 'slug': 'cake'}])
+
+            # nothing has changed since the last cursor
+            cursor = page['cursor']
+            self.assertEqual(self.changes(cursor), {'cursor': cursor, 'has_more': False, 'changed': [], 'deleted': []})
+
+    def test_in_progress_transactions(self):
+        # changes of transactions which may still be in progress aren't returned, e.g., a transaction which started
+        # before the latest returned change but commits after it
+        recipe = create_recipe('Soup')
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT txid_current()')
+            transaction_id = cursor.fetchone()[0]
+        RecipeChange.objects.create(transaction_id=transaction_id + 1000, recipe_id=recipe.id, slug=recipe.slug)
+        page = self.changes()
+        self.assertEqual([r['slug'] for r in page['changed']], ['soup'])
+        self.assertEqual(page['cursor'].split('-')[0], str(RecipeChange.objects.order_by('id').first().transaction_id))
+
+    def test_compact(self):
+        soup, salad = create_recipe('Soup'), create_recipe('Salad')
+        soup.name = 'Tomato Soup'
+        soup.save()
+        salad_id = salad.id
+        salad.delete()
+        RecipeChange.objects.filter(recipe_id=salad_id, deleted=True).update(
+            changed_at=RecipeChange.objects.get(recipe_id=salad_id, deleted=True).changed_at - timedelta(days=91))
+
+        # the insert of each recipe is superseded and the salad's tombstone has expired
+        self.assertEqual(RecipeChange.compact(), 3)
+        self.assertEqual(self.changes()['changed'][0]['name'], 'Tomato Soup')
+        self.assertEqual(list(RecipeChange.objects.values_list('slug', flat=True)), ['soup'])